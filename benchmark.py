@@ -0,0 +1,497 @@
+import re
+import sys
+import json
+import math
+import pstats
+import cProfile
+import random
+import timeit
+import simple_svg_parser
+
+class NullHandler(simple_svg_parser.HandlerInterface):
+  pass
+
+# Something resembling a glyph from an icon font: long runs of compact relative
+# commands with implicit repeats and numbers that aren't separated by spaces
+def icon_font_path(commands, seed=0):
+  rng = random.Random(seed)
+  def numbers(count):
+    text = ''
+    for i in range(count):
+      value = ('%.2f' % rng.uniform(-20, 20)).replace('0.', '.')
+      text += value if not text or value[0] == '-' else ' ' + value
+    return text
+  parts = ['M' + numbers(2)]
+  for i in range(commands):
+    kind = rng.choice('lcqshv')
+    parts.append(kind + numbers({'l': 4, 'c': 6, 'q': 4, 's': 4, 'h': 1, 'v': 1}[kind]))
+    if i % 50 == 49: parts.append('zm' + numbers(2))
+  return ''.join(parts) + 'z'
+
+# The regex split tokenizer and per-token number check that _tokenize_path()
+# replaced, kept for comparison
+def legacy_tokenize_path(text):
+  tokens = [x.strip() for x in re.split(r'([+-]?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|[+-]?\.\d+(?:[eE][+-]?\d+)?|\b\s+\b|\w(?=\w))', text)]
+  tokens = [x for x in tokens if x not in ['', ',']]
+  groups = []
+  for token in tokens:
+    if re.match(r'.*\d.*', token): groups[-1][1].append(float(token))
+    else: groups.append((token, []))
+  return groups
+
+def best(fn, repeat=5, number=1):
+  return min(timeit.repeat(fn, repeat=repeat, number=number)) / number
+
+def bench_path_tokenize():
+  d = icon_font_path(20000)
+  megabytes = len(d) / 1e6
+  legacy = best(lambda: legacy_tokenize_path(d))
+  current = best(lambda: simple_svg_parser._tokenize_path(d))
+  print('path tokenize (%.1f MB)' % megabytes)
+  print('  legacy tokenizer:  %7.2f MB/s' % (megabytes / legacy))
+  print('  _tokenize_path:    %7.2f MB/s (%.1fx)' % (megabytes / current, legacy / current))
+
+def bench_path_parse():
+  d = icon_font_path(20000)
+  svg = '<svg xmlns="http://www.w3.org/2000/svg"><path d="%s"/></svg>' % d
+  megabytes = len(d) / 1e6
+  seconds = best(lambda: simple_svg_parser.parse(svg, NullHandler()), repeat=3)
+  print('path parse (%.1f MB)' % megabytes)
+  print('  parse():           %7.2f MB/s' % (megabytes / seconds))
+
+# Counts constructor calls for the parser's geometry classes while parsing
+def count_constructions(fn):
+  counts = {}
+  def profile(frame, event, arg):
+    code = frame.f_code
+    if event == 'call' and code.co_name == '__init__' and code.co_filename == simple_svg_parser.__file__:
+      name = type(frame.f_locals['self']).__name__
+      counts[name] = counts.get(name, 0) + 1
+  sys.setprofile(profile)
+  try: fn()
+  finally: sys.setprofile(None)
+  return counts
+
+def bench_transform():
+  curves = 20000
+  d = 'M0 0' + 'c1 2 3 4 5 6q1 2 3 4' * (curves // 2)
+  for label, attrs in [('identity', ''), ('transformed', ' transform="matrix(2 0 0 2 10 10)"')]:
+    svg = '<svg xmlns="http://www.w3.org/2000/svg"><path%s d="%s"/></svg>' % (attrs, d)
+    seconds = best(lambda: simple_svg_parser.parse(svg, NullHandler()), repeat=3)
+    counts = count_constructions(lambda: simple_svg_parser.parse(svg, NullHandler()))
+    print('transform (%s, %d curves)' % (label, curves))
+    print('  time per curve:    %7.2f us' % (seconds / curves * 1e6))
+    print('  objects per curve: %7.2f (%s)' % (sum(counts.values()) / float(curves),
+      ', '.join('%s: %d' % item for item in sorted(counts.items())) or 'none'))
+
+# What callers did before the tolerance option: a fixed number of steps per
+# curve no matter how big it ends up on screen
+class UniformFlattener(simple_svg_parser.HandlerInterface):
+  def __init__(self, steps):
+    self.steps = steps
+    self.vertices = 0
+    self.x = self.y = 0
+
+  def moveTo(self, x, y):
+    self.x, self.y = x, y
+    self.vertices += 1
+
+  def lineTo(self, x, y):
+    self.x, self.y = x, y
+    self.vertices += 1
+
+  def curveTo(self, x1, y1, x2, y2, x3, y3):
+    x0, y0 = self.x, self.y
+    for i in range(1, self.steps + 1):
+      t = i / float(self.steps)
+      s = 1 - t
+      a, b, c, d = s * s * s, 3 * s * s * t, 3 * s * t * t, t * t * t
+      self.lineTo(a * x0 + b * x1 + c * x2 + d * x3, a * y0 + b * y1 + c * y2 + d * y3)
+
+class VertexCounter(simple_svg_parser.HandlerInterface):
+  def __init__(self):
+    self.vertices = 0
+
+  def moveTo(self, x, y):
+    self.vertices += 1
+
+  def lineTo(self, x, y):
+    self.vertices += 1
+
+# Icons of many sizes: lots of small circles and rounded rects plus a few big
+# glyphs, drawn through a viewBox that scales them up
+def icon_sheet(count, seed=0):
+  rng = random.Random(seed)
+  shapes = []
+  for i in range(count):
+    x, y = rng.uniform(0, 1000), rng.uniform(0, 1000)
+    kind = rng.choice('crp')
+    if kind == 'c': shapes.append('<circle cx="%.1f" cy="%.1f" r="%.1f"/>' % (x, y, rng.uniform(1, 40)))
+    elif kind == 'r': shapes.append('<rect x="%.1f" y="%.1f" width="%.1f" height="%.1f" rx="%.1f"/>' % (x, y, rng.uniform(5, 60), rng.uniform(5, 60), rng.uniform(1, 5)))
+    else: shapes.append('<path transform="translate(%.1f %.1f)" d="%s"/>' % (x, y, icon_font_path(20, seed + i)))
+  return '<svg xmlns="http://www.w3.org/2000/svg" width="2000" height="2000" viewBox="0 0 1000 1000">%s</svg>' % ''.join(shapes)
+
+def bench_flatten():
+  svg = icon_sheet(1000)
+  print('flatten (1000 shapes)')
+  for steps in [8, 16]:
+    seconds = best(lambda: simple_svg_parser.parse(svg, UniformFlattener(steps)), repeat=3)
+    handler = UniformFlattener(steps)
+    simple_svg_parser.parse(svg, handler)
+    print('  uniform, %2d steps:     %7d vertices %7.1f ms' % (steps, handler.vertices, seconds * 1000))
+  for tolerance in [1, 0.25, 0.1]:
+    seconds = best(lambda: simple_svg_parser.parse(svg, VertexCounter(), tolerance=tolerance), repeat=3)
+    handler = VertexCounter()
+    simple_svg_parser.parse(svg, handler, tolerance=tolerance)
+    print('  adaptive, %4.2f px:    %7d vertices %7.1f ms' % (tolerance, handler.vertices, seconds * 1000))
+
+# A large sheet of simple shapes that share a handful of colors and styles
+def styled_sheet(count, seed=0):
+  rng = random.Random(seed)
+  colors = ['#FF0000', '#0f0', 'navy', 'rgb(10, 20, 30)', 'rgba(200, 100, 50, 0.5)', 'gold']
+  shapes = []
+  for i in range(count):
+    x, y = rng.uniform(0, 1000), rng.uniform(0, 1000)
+    if i % 2:
+      shapes.append('<rect x="%.1f" y="%.1f" width="10px" height="10px" fill="%s" stroke="%s" stroke-width="2px"/>' %
+        (x, y, rng.choice(colors), rng.choice(colors)))
+    else:
+      shapes.append('<circle cx="%.1f" cy="%.1f" r="5" style="fill: %s; stroke: %s; stroke-width: 1.5"/>' %
+        (x, y, rng.choice(colors), rng.choice(colors)))
+  return '<svg xmlns="http://www.w3.org/2000/svg">%s</svg>' % ''.join(shapes)
+
+def profile(fn):
+  profiler = cProfile.Profile()
+  profiler.runcall(fn)
+  stats = pstats.Stats(profiler)
+  calls = dict((name, (nc, tt)) for (file, line, name), (cc, nc, tt, ct, callers) in stats.stats.items())
+  return stats.total_calls, stats.total_tt, calls
+
+def bench_styles():
+  svg = styled_sheet(20000)
+  memoized = [name for name in ['_color', '_units', '_style'] if hasattr(getattr(simple_svg_parser, name), '__wrapped__')]
+  print('color, unit and style parsing (20000 shapes)')
+  for label, uncached in [('uncached', True), ('memoized', False)]:
+    saved = dict((name, getattr(simple_svg_parser, name)) for name in memoized)
+    if uncached:
+      for name in memoized: setattr(simple_svg_parser, name, saved[name].__wrapped__)
+    try:
+      seconds = best(lambda: simple_svg_parser.parse(svg, NullHandler()), repeat=3)
+      calls, tt, functions = profile(lambda: simple_svg_parser.parse(svg, NullHandler()))
+    finally:
+      for name in memoized: setattr(simple_svg_parser, name, saved[name])
+    regex = sum(nc for name, (nc, t) in functions.items() if name in ("<method 'match' of 're.Pattern' objects>", 'match'))
+    print('  %s: %7.1f ms, %8d function calls, %6d regex matches' % (label, seconds * 1000, calls, regex))
+
+# Pie charts: every slice is a wedge with an arc, some of them large
+def pie_charts(charts, slices, seed=0):
+  rng = random.Random(seed)
+  paths = []
+  for chart in range(charts):
+    cx, cy, r = rng.uniform(0, 1000), rng.uniform(0, 1000), rng.uniform(10, 100)
+    angles = sorted(rng.uniform(0, 360) for i in range(slices - 1))
+    angles = [0] + angles + [360]
+    for a, b in zip(angles, angles[1:]):
+      x0, y0 = cx + r * math.cos(math.radians(a)), cy + r * math.sin(math.radians(a))
+      x1, y1 = cx + r * math.cos(math.radians(b)), cy + r * math.sin(math.radians(b))
+      paths.append('<path d="M%.2f %.2fL%.2f %.2fA%.2f %.2f 0 %d 1 %.2f %.2fZ"/>' % (cx, cy, x0, y0, r, r, b - a > 180, x1, y1))
+  return '<svg xmlns="http://www.w3.org/2000/svg">%s</svg>' % ''.join(paths)
+
+def bench_arcs():
+  charts, slices = 1000, 8
+  svg = pie_charts(charts, slices)
+  seconds = best(lambda: simple_svg_parser.parse(svg, NullHandler()), repeat=3)
+  print('arcs (%d pie charts, %d slices each)' % (charts, slices))
+  print('  parse():           %7.0f arcs/s' % (charts * slices / seconds))
+
+# A map split into regions, each a group of detailed outlines near its center
+def region_map(regions, shapes, seed=0):
+  rng = random.Random(seed)
+  groups = []
+  for i in range(regions):
+    x, y = rng.uniform(0, 4000), rng.uniform(0, 4000)
+    paths = ['<path transform="translate(%.1f %.1f)" d="%s"/>' % (rng.uniform(-100, 100), rng.uniform(-100, 100), icon_font_path(10, seed + i * shapes + j))
+      for j in range(shapes)]
+    groups.append('<g transform="translate(%.1f %.1f)">%s</g>' % (x, y, ''.join(paths)))
+  return '<svg xmlns="http://www.w3.org/2000/svg" width="4000" height="4000">%s</svg>' % ''.join(groups)
+
+def bench_clip():
+  regions, shapes, tiles = 100, 50, 4
+  svg = region_map(regions, shapes)
+  size = 4000.0 / tiles
+  clips = [(x * size, y * size, (x + 1) * size, (y + 1) * size) for x in range(tiles) for y in range(tiles)]
+  print('clip (%d regions of %d paths, %d tiles)' % (regions, shapes, len(clips)))
+  seconds = best(lambda: simple_svg_parser.parse(svg, NullHandler()), repeat=3)
+  print('  whole document:    %7.1f ms' % (seconds * 1000))
+  def tiled(clipCache):
+    for clip in clips:
+      simple_svg_parser.parse(svg, NullHandler(), clip=clip, clipCache=clipCache)
+  seconds = best(lambda: tiled(None), repeat=3)
+  print('  clip per tile:     %7.1f ms' % (seconds / len(clips) * 1000))
+  clipCache = {}
+  tiled(clipCache)
+  seconds = best(lambda: tiled(clipCache), repeat=3)
+  print('  cached per tile:   %7.1f ms' % (seconds / len(clips) * 1000))
+
+# Survey-grade outlines like GIS exports: long random walks with a point every
+# few meters, shown through a viewBox that fits a whole region into 1000 pixels
+def gis_polylines(count, points, seed=0):
+  rng = random.Random(seed)
+  lines = []
+  for i in range(count):
+    x, y, heading = rng.uniform(0, 100000), rng.uniform(0, 100000), rng.uniform(0, 2 * math.pi)
+    coords = []
+    for j in range(points):
+      heading += rng.gauss(0, 0.3)
+      x += 5 * math.cos(heading)
+      y += 5 * math.sin(heading)
+      coords.append('%.1f,%.1f' % (x, y))
+    lines.append('<polyline points="%s" fill="none" stroke="black"/>' % ' '.join(coords))
+  return '<svg xmlns="http://www.w3.org/2000/svg" width="1000" height="1000" viewBox="0 0 100000 100000">%s</svg>' % ''.join(lines)
+
+def bench_simplify():
+  count, points = 20, 10000
+  svg = gis_polylines(count, points)
+  print('simplify (%d polylines of %d points)' % (count, points))
+  for simplify in [None, 0.1, 0.5, 1]:
+    seconds = best(lambda: simple_svg_parser.parse(svg, VertexCounter(), simplify=simplify), repeat=3)
+    handler = VertexCounter()
+    simple_svg_parser.parse(svg, handler, simplify=simplify)
+    print('  %-14s %7d vertices %7.1f ms' % ('%s px:' % simplify if simplify else 'unsimplified:', handler.vertices, seconds * 1000))
+
+# Groups nested "depth" deep, each with its own transform and a shape, so the
+# transform stack is exercised more than the path parser
+def nested_groups(trees, depth, seed=0):
+  rng = random.Random(seed)
+  parts = []
+  for i in range(trees):
+    for level in range(depth):
+      parts.append('<g transform="translate(%.1f %.1f) rotate(%.1f) scale(0.99)">' % (rng.uniform(-5, 5), rng.uniform(-5, 5), rng.uniform(-10, 10)))
+      parts.append('<rect width="%.1f" height="%.1f" fill="#%06x"/>' % (rng.uniform(1, 20), rng.uniform(1, 20), rng.randrange(1 << 24)))
+    parts.append('</g>' * depth)
+  return '<svg xmlns="http://www.w3.org/2000/svg" width="1000" height="1000">%s</svg>' % ''.join(parts)
+
+# Lots of unstyled shapes side by side, one per line like exported files, so
+# most of the time goes to visiting elements rather than drawing them
+def flat_sheet(count, seed=0):
+  rng = random.Random(seed)
+  shapes = ['  <rect x="%.1f" y="%.1f" width="4" height="4"/>\n' % (rng.uniform(0, 1000), rng.uniform(0, 1000)) for i in range(count)]
+  return '<svg xmlns="http://www.w3.org/2000/svg">\n%s</svg>' % ''.join(shapes)
+
+def bench_traversal():
+  print('traversal')
+  for label, svg, elements in [
+    ('deep (50 x 100 groups)', nested_groups(50, 100), 50 * 100 * 2),
+    ('wide (20000 rects)', flat_sheet(20000), 20000),
+  ]:
+    seconds = best(lambda: simple_svg_parser.parse(svg, NullHandler()), repeat=5)
+    print('  %-24s %7.1f ms %9.0f elements/s' % (label + ':', seconds * 1000, elements / seconds))
+  deepest = 0
+  for depth in [2 ** i for i in range(1, 17)]:
+    try: simple_svg_parser.parse('<svg>%s%s</svg>' % ('<g>' * depth, '</g>' * depth), NullHandler())
+    except RuntimeError: break
+    deepest = depth
+  print('  deepest nesting parsed:  %7d levels (tried up to %d)' % (deepest, 2 ** 16))
+
+# Documents built from a small icon library: every document places the same
+# few glyphs many times at different positions
+def icon_documents(documents, icons, placements, seed=0):
+  rng = random.Random(seed)
+  glyphs = [icon_font_path(40, seed + i) for i in range(icons)]
+  return ['<svg xmlns="http://www.w3.org/2000/svg">%s</svg>' % ''.join(
+    '<path transform="translate(%.1f %.1f)" d="%s"/>' % (rng.uniform(0, 1000), rng.uniform(0, 1000), rng.choice(glyphs))
+    for j in range(placements)) for i in range(documents)]
+
+def bench_geometry_cache():
+  documents = icon_documents(20, 50, 200)
+  print('geometry cache (20 documents, 200 uses of 50 icons each)')
+  def parse_all(geometryCache):
+    for svg in documents:
+      simple_svg_parser.parse(svg, NullHandler(), geometryCache=geometryCache)
+  seconds = best(lambda: parse_all(None), repeat=3)
+  print('  uncached:          %7.1f ms' % (seconds * 1000))
+  cache = simple_svg_parser.GeometryCache()
+  seconds = best(lambda: parse_all(cache), repeat=3)
+  print('  interned:          %7.1f ms (%d hits, %d misses, %d KB)' % (seconds * 1000, cache.hits, cache.misses, cache.bytes // 1024))
+
+# Transforming recorded outlines as they're replayed, from a geometry cache
+# and from record() with a matrix
+def bench_vectorize():
+  numpy = simple_svg_parser._numpy()
+  print('vectorize (%s)' % ('NumPy %s' % numpy.__version__ if numpy else 'NumPy not installed, so this is the fallback'))
+  for commands in [10, 100, 1000, 10000]:
+    count = max(1, 20000 // commands)
+    glyphs = [icon_font_path(commands, i) for i in range(5)]
+    svg = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100" width="1000" height="1000">%s</svg>' % ''.join(
+      '<path transform="rotate(%d)" d="%s"/>' % (i, glyphs[i % 5]) for i in range(count))
+    cache = simple_svg_parser.GeometryCache()
+    simple_svg_parser.parse(svg, NullHandler(), geometryCache=cache)
+    plain = best(lambda: simple_svg_parser.parse(svg, NullHandler(), geometryCache=cache), repeat=3)
+    vectorized = best(lambda: simple_svg_parser.parse(svg, NullHandler(), geometryCache=cache, vectorize=True), repeat=3)
+    print('  %5d commands x %4d: %7.1f ms cached %7.1f ms vectorized (%.2fx)' % (commands, count, plain * 1000, vectorized * 1000, plain / vectorized))
+  recorded = simple_svg_parser.record(svg)
+  seconds = best(lambda: recorded.replay(NullHandler(), matrix=(2, 0, 0, 2, 1, 1)))
+  print('  replay with a matrix:  %7.1f ms' % (seconds * 1000))
+
+# Icons with holes: rings and framed squares with a few windows each. The
+# windows are only holes with the evenodd rule, which bench_triangulate() uses.
+def holed_icons(count, seed=0):
+  rng = random.Random(seed)
+  shapes = []
+  for i in range(count):
+    x, y, r = rng.uniform(0, 1000), rng.uniform(0, 1000), rng.uniform(5, 30)
+    if i % 2:
+      shapes.append('<path d="M%.1f %.1fa%.1f %.1f 0 1 0 0 %.1fa%.1f %.1f 0 1 0 0 %.1fzm0 %.1fa%.1f %.1f 0 1 1 0 %.1fa%.1f %.1f 0 1 1 0 %.1fz"/>' %
+        (x, y - r, r, r, 2 * r, r, r, -2 * r, r / 2, r / 2, r / 2, r, r / 2, r / 2, -r))
+    else:
+      windows = ''.join('M%.1f %.1fh%.1fv%.1fh%.1fz' % (x + r * (0.2 + 0.4 * (j % 2)), y + r * (0.2 + 0.4 * (j // 2)), r * 0.3, r * 0.3, -r * 0.3) for j in range(4))
+      shapes.append('<path d="M%.1f %.1fh%.1fv%.1fh%.1fz%s"/>' % (x, y, r, r, -r, windows))
+  return '<svg xmlns="http://www.w3.org/2000/svg" width="1000" height="1000">%s</svg>' % ''.join(shapes)
+
+def bench_triangulate():
+  print('triangulate')
+  for label, svg in [('icon sheet, 1000 shapes', icon_sheet(1000)), ('holed icons, 1000 shapes', holed_icons(1000))]:
+    parsed = best(lambda: simple_svg_parser.parse(svg, NullHandler()), repeat=3)
+    meshes = []
+    handler = lambda: simple_svg_parser.TriangulatingHandler(meshes.append, fillRule='evenodd')
+    seconds = best(lambda: simple_svg_parser.parse(svg, handler()), repeat=3)
+    del meshes[:]
+    simple_svg_parser.parse(svg, handler())
+    triangles = sum(len(mesh.indices) for mesh in meshes) // 3
+    print('  %-26s %7.1f ms parse %7.1f ms triangulated, %6d triangles (%.0f/s)' % (label + ':', parsed * 1000, seconds * 1000, triangles, triangles / seconds))
+
+# Encoding recorded geometry for the network, quantized to a grid versus the
+# plain floats of BinaryWriter, and decoding it again
+def bench_quantize():
+  print('quantize')
+  for label, svg in [('icon sheet, 2000 shapes', icon_sheet(2000)), ('map regions', region_map(400, 20))]:
+    recorded = simple_svg_parser.record(svg)
+    points = sum(len(path.coords) for path in recorded.paths) // 2
+    print('  %s (%d points):' % (label, points))
+    for name, writer, reader in [
+        ('float64', lambda: simple_svg_parser.BinaryWriter(doublePrecision=True), simple_svg_parser.BinaryGeometry),
+        ('float32', lambda: simple_svg_parser.BinaryWriter(), simple_svg_parser.BinaryGeometry),
+        ('grid 1/64', lambda: simple_svg_parser.QuantizedWriter(grid=1.0 / 64), simple_svg_parser.QuantizedGeometry),
+        ('grid 1', lambda: simple_svg_parser.QuantizedWriter(grid=1), simple_svg_parser.QuantizedGeometry)]:
+      def encode():
+        w = writer()
+        recorded.replay(w)
+        return w.getvalue()
+      data = encode()
+      encoded = best(encode, repeat=3)
+      decoded = best(lambda: reader(data).replay(NullHandler()), repeat=3)
+      print('    %-10s %8d bytes (%5.2f per point) %7.1f ms encode %7.1f ms decode (%.1fM points/s)' % (
+        name + ':', len(data), len(data) / float(points), encoded * 1000, decoded * 1000, points / decoded / 1e6))
+
+# The corpora used by suite(), as (name, svg) pairs
+def corpora():
+  return [
+    ('icon set', icon_sheet(2000)),
+    ('huge path', '<svg xmlns="http://www.w3.org/2000/svg"><path d="%s"/></svg>' % icon_font_path(50000)),
+    ('deep groups', nested_groups(50, 100)),
+    ('colored shapes', styled_sheet(20000)),
+  ]
+
+# Returns the most memory allocated at once while running fn(), or None if
+# tracemalloc isn't available
+def peak_memory(fn):
+  try:
+    import tracemalloc
+  except ImportError:
+    return None
+  tracemalloc.start()
+  try:
+    fn()
+    return tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+
+def result(benchmark, corpus, fn, elements, segments, repeat=3):
+  seconds = best(fn, repeat=repeat)
+  return {
+    'benchmark': benchmark,
+    'corpus': corpus,
+    'seconds': seconds,
+    'elements': elements,
+    'segments': segments,
+    'elementsPerSecond': elements / seconds,
+    'segmentsPerSecond': segments / seconds,
+    'peakBytes': peak_memory(fn),
+  }
+
+# Measures parse() on every corpus and the path tokenizer, color parser and
+# transform parser on the parts of them they would see. Elements are whatever
+# each function handles one of (elements, path commands, colors, transforms)
+# and segments are drawing calls made to the handler. The color and transform
+# parsers are measured without their caches so the numbers track the parsing
+# itself.
+def suite():
+  results = []
+  for name, svg in corpora():
+    stats = simple_svg_parser.Stats()
+    simple_svg_parser.parse(svg, NullHandler(), stats=stats)
+    results.append(result('parse', name, lambda: simple_svg_parser.parse(svg, NullHandler()),
+      sum(stats.elements.values()), sum(stats.segments.values())))
+
+    paths = re.findall(r' d="([^"]*)"', svg)
+    if paths:
+      results.append(result('_tokenize_path', name, lambda: [simple_svg_parser._tokenize_path(d) for d in paths],
+        sum(stats.commands.values()), 0))
+
+    colors = re.findall(r'(?:fill|stroke)[=:]\s*"?([^";]+)', svg)
+    if colors:
+      color = simple_svg_parser._color.__wrapped__
+      results.append(result('_color', name, lambda: [color(c) for c in colors], len(colors), 0))
+
+    transforms = re.findall(r' transform="([^"]*)"', svg)
+    if transforms:
+      matrix = simple_svg_parser._matrix.__wrapped__
+      def transform():
+        m = simple_svg_parser._Matrix()
+        for t in transforms:
+          m = m.multiply(matrix(t))
+      results.append(result('transform', name, transform, len(transforms), 0))
+  return results
+
+# Prints how much faster (above 1) or slower each result is than the same one
+# in an earlier run
+def compare(results, baseline):
+  previous = dict(((r['benchmark'], r['corpus']), r) for r in baseline)
+  for r in results:
+    old = previous.get((r['benchmark'], r['corpus']))
+    if old:
+      print('%-15s %-15s %6.2fx' % (r['benchmark'], r['corpus'], old['seconds'] / r['seconds']))
+
+def main(args=None):
+  import argparse
+  parser = argparse.ArgumentParser(description='Benchmarks for simple_svg_parser')
+  parser.add_argument('--json', metavar='FILE', help='run the suite and write its results as JSON to FILE, or - for stdout')
+  parser.add_argument('--compare', metavar='FILE', help='run the suite and compare it to results saved with --json')
+  options = parser.parse_args(args)
+  if not options.json and not options.compare:
+    bench_path_tokenize()
+    bench_path_parse()
+    bench_transform()
+    bench_flatten()
+    bench_styles()
+    bench_arcs()
+    bench_clip()
+    bench_simplify()
+    bench_traversal()
+    bench_geometry_cache()
+    bench_vectorize()
+    bench_triangulate()
+    bench_quantize()
+    return
+  results = suite()
+  if options.json == '-':
+    print(json.dumps(results, indent=2, sort_keys=True))
+  elif options.json:
+    with open(options.json, 'w') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+  if options.compare:
+    with open(options.compare) as f:
+      compare(results, json.load(f))
+
+if __name__ == '__main__':
+  main()
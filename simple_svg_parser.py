@@ -1,11 +1,121 @@
+import io
+import os
 import re
+import sys
 import math
+import time
+import mmap
+import array
+import struct
+import pickle
+import hashlib
+import tempfile
+import threading
+import collections
 import xml.dom.minidom
-
-# The entry point for this library
-def parse(text, handler):
+import xml.parsers.expat
+
+# The entry point for this library. Takes these optional keyword arguments:
+#
+#   tolerance  Replace curves with lines that are never further than this from
+#              the curve in output pixels, using as few lines as possible
+#   simplify   Drop points from runs of straight lines as long as the result
+#              stays within this many output pixels of every original point,
+#              for drawing detailed outlines at small sizes
+#   bounds     A Bounds object to fill in with the bounding box of every path
+#   clip       A (minX, minY, maxX, maxY) rectangle in output pixels. Paths that
+#              are entirely outside it, including their strokes, are dropped
+#   stats      A Stats object to add counts and timings for the parse to
+#   geometryCache  A GeometryCache to share parsed outlines through
+#   vectorize  Transform the points of recorded outlines (from geometryCache
+#              or <use>) all at once with NumPy instead of one at a time,
+#              which is faster for big paths. Does nothing if NumPy isn't
+#              installed.
+#   clipCache  A dict to remember the bounds of every element in when using
+#              clip. Pass the same dict when parsing the same document again
+#              with a different clip (for example for each tile of a map) and
+#              elements and whole groups outside the rectangle are skipped
+#              without being parsed. Don't share it between documents.
+#
+def parse(text, handler, **options):
+  start = _clock()
   doc = xml.dom.minidom.parseString(text)
-  _Parser(handler).visit(doc)
+  loaded = _clock()
+  parser = _Parser(handler, **options)
+  parser.lookup = _dom_lookup(doc)
+  parser.visit(doc)
+  if parser.stats is not None:
+    parser.stats._finish(loaded - start, _clock() - start)
+
+# Like parse() but reads the XML incrementally from a file object, so only the
+# current element stack is kept in memory and the handler is called while the
+# rest of the document is still being read. Takes the same options as parse().
+# Since earlier parts of the document are gone, <use> can only refer to
+# elements inside a <defs> or <symbol> that came before it.
+def parse_stream(fileobj, handler, chunkSize=65536, **options):
+  for _ in _parse_chunks(fileobj, handler, chunkSize, options):
+    pass
+
+# Yields the shapes in an SVG one at a time as PackedPath objects, with
+# opacity already applied to the fill and stroke colors. The document is read
+# "chunkSize" characters at a time as more shapes are asked for, so stopping
+# early skips the work for the rest of it. Takes the same options as parse()
+# and has the same limits on <use> as parse_stream().
+def iter_shapes(text, chunkSize=4096, **options):
+  shapes = collections.deque()
+  fileobj = io.BytesIO(text) if isinstance(text, bytes) else io.StringIO(text)
+  for _ in _parse_chunks(fileobj, PackedHandler(shapes.append), chunkSize, options):
+    while shapes:
+      yield shapes.popleft()
+  while shapes:
+    yield shapes.popleft()
+
+# Does the work for parse_stream(), yielding after each chunk
+def _parse_chunks(fileobj, handler, chunkSize, options):
+  stream = _StreamParser(handler, options)
+  while True:
+    data = fileobj.read(chunkSize)
+    if not data: break
+    stream.feed(data)
+    yield
+  stream.close()
+
+# Parses XML with expat as it arrives, for parse_stream() and the other
+# incremental entry points. Call feed() with each piece of the document and
+# then close().
+class _StreamParser:
+  def __init__(self, handler, options):
+    self.start = _clock()
+    self.parser = _Parser(handler, **options)
+    self.parser.captured = []
+    # A Stats object can be shared between parses, so remember how much time
+    # it already had to work out what this parse added
+    stats = self.parser.stats
+    self.timed = stats.timings['paths'] + stats.timings['transforms'] + stats.timings['handler'] if stats is not None else 0
+    self.expat = xml.parsers.expat.ParserCreate()
+    self.expat.StartElementHandler = self.parser.startElement
+    self.expat.EndElementHandler = self.parser.endElement
+
+  def feed(self, data):
+    self.expat.Parse(data, False)
+
+  def close(self):
+    self.expat.Parse('', True)
+    stats = self.parser.stats
+    if stats is not None:
+      timings = stats.timings
+      total = _clock() - self.start
+      timed = timings['paths'] + timings['transforms'] + timings['handler'] - self.timed
+      stats._finish(total - timed, total)
+
+# Parses many SVGs in parallel using a pool of worker processes. Each source is
+# either a file path or the SVG contents as bytes. Returns one BatchResult per
+# source in the same order. A source that fails to parse gets a result with
+# "error" set instead of stopping the rest of the batch.
+def parse_batch(sources, workers=None, chunkSize=16):
+  import concurrent.futures
+  with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+    return list(executor.map(_parse_batch_item, sources, chunksize=chunkSize))
 
 # Implement this interface and pass it to parse()
 class HandlerInterface:
@@ -17,6 +127,744 @@ class HandlerInterface:
   def closePath(self): pass
   def fill(self, r, g, b, a): pass
   def stroke(self, r, g, b, a, width): pass
+  def endPath(self): pass # Optional, called after the fill and stroke of each path
+
+# Command codes used by PackedPath.commands
+MOVE_TO = 0
+LINE_TO = 1
+CURVE_TO = 2
+CLOSE_PATH = 3
+
+# One path packed into flat arrays. Each entry in "commands" is one of the
+# codes above and consumes 2 (MOVE_TO, LINE_TO), 6 (CURVE_TO) or 0 (CLOSE_PATH)
+# numbers from "coords". Both arrays support the buffer protocol, so something
+# like numpy.frombuffer() can use them without copying. "fill" is (r, g, b, a)
+# and "stroke" is (r, g, b, a, width), and either may be None.
+class PackedPath:
+  def __init__(self):
+    self.commands = array.array('B')
+    self.coords = array.array('d')
+    self.fill = None
+    self.stroke = None
+
+  # Sends this path to a HandlerInterface one call at a time, optionally
+  # transformed by "matrix" (see ParsedSVG.replay())
+  def replay(self, handler, matrix=None):
+    self._replay(handler, _replay_matrix(matrix) if matrix else None)
+
+  def _replay(self, handler, m):
+    coords = self.coords
+    strokeScale = 1
+    if m is not None and not m.identity:
+      coords = _transform_coords(coords, m)
+      strokeScale = _stroke_scale(m)
+    _replay_path(handler, self.commands, coords, 0, self.fill, self.stroke, strokeScale)
+
+# Pass this to parse() to get each path as a PackedPath instead of one call per
+# segment. The callback is called once per path after its fill and stroke are
+# known. Metadata is ignored, so override metadata() if it's needed.
+class PackedHandler(HandlerInterface):
+  def __init__(self, callback):
+    self.callback = callback
+    self.path = None
+
+  def beginPath(self):
+    self.path = PackedPath()
+    self.command = self.path.commands.append
+    self.coords = self.path.coords.extend
+
+  def moveTo(self, x, y):
+    self.command(MOVE_TO)
+    self.coords((x, y))
+
+  def lineTo(self, x, y):
+    self.command(LINE_TO)
+    self.coords((x, y))
+
+  def curveTo(self, x1, y1, x2, y2, x3, y3):
+    self.command(CURVE_TO)
+    self.coords((x1, y1, x2, y2, x3, y3))
+
+  def closePath(self):
+    self.command(CLOSE_PATH)
+
+  def fill(self, r, g, b, a):
+    self.path.fill = (r, g, b, a)
+
+  def stroke(self, r, g, b, a, width):
+    self.path.stroke = (r, g, b, a, width)
+
+  def endPath(self):
+    self.callback(self.path)
+    self.path = None
+
+# The triangles covering one filled path. "vertices" has float32 x, y pairs,
+# "indices" has three uint32 indices into them per triangle and "fill" is
+# (r, g, b, a). Like PackedPath, both arrays support the buffer protocol.
+class TriangleMesh:
+  def __init__(self, fill):
+    self.vertices = array.array('f')
+    self.indices = array.array('I')
+    self.fill = fill
+
+# Pass this to parse() to get the fill of each path as triangles, ready for a
+# vertex buffer. Curves are replaced by lines no further than "tolerance" from
+# them in output pixels. Each contour with holes in it becomes one polygon
+# following "fillRule" ('nonzero' or 'evenodd'), which is then split into
+# triangles by clipping ears. Contours that cross each other aren't supported
+# and may produce overlapping triangles. The callback is called with a
+# TriangleMesh for each filled path. Strokes and metadata are ignored, and so
+# is the fill-rule attribute since handlers don't see it: "fillRule" applies to
+# every path.
+class TriangulatingHandler(HandlerInterface):
+  def __init__(self, callback, tolerance=0.25, fillRule='nonzero'):
+    if fillRule not in ('nonzero', 'evenodd'): raise Exception('Unsupported fill rule: %s' % repr(fillRule))
+    self.callback = callback
+    self.tolerance = tolerance
+    self.fillRule = fillRule
+    self.contours = []
+    self.x = self.y = 0
+
+  def beginPath(self):
+    self.contours = []
+
+  def moveTo(self, x, y):
+    self.contours.append([x, y])
+    self.x = x
+    self.y = y
+
+  def lineTo(self, x, y):
+    if not self.contours: self.contours.append([self.x, self.y])
+    self.contours[-1] += (x, y)
+    self.x = x
+    self.y = y
+
+  def curveTo(self, x1, y1, x2, y2, x3, y3):
+    _flatten_cubic(self.x, self.y, x1, y1, x2, y2, x3, y3, self.tolerance, self.lineTo)
+
+  def closePath(self):
+    if self.contours:
+      contour = self.contours[-1]
+      self.x, self.y = contour[0], contour[1]
+      self.contours.append([self.x, self.y])
+
+  def fill(self, r, g, b, a):
+    mesh = TriangleMesh((r, g, b, a))
+    _triangulate(self.contours, self.fillRule == 'evenodd', mesh)
+    if mesh.indices:
+      self.callback(mesh)
+
+# Everything a parse sent to its handler, kept so it can be sent to another
+# handler later without parsing the XML again. "metadata" is the dict passed
+# to HandlerInterface.metadata() (or None) and "paths" is a list of PackedPath.
+class ParsedSVG:
+  def __init__(self):
+    self.metadata = None
+    self.paths = []
+
+  # Sends the recorded calls to a HandlerInterface. The optional "matrix" is an
+  # extra transform (a, b, c, d, e, f) in the order used by the SVG matrix()
+  # syntax, applied to all points. Stroke widths are scaled to match.
+  def replay(self, handler, matrix=None):
+    m = _replay_matrix(matrix) if matrix else None
+    if self.metadata is not None:
+      handler.metadata(self.metadata)
+    for path in self.paths:
+      path._replay(handler, m)
+
+# Pass this to parse() to record everything into the ParsedSVG in "result"
+class RecordingHandler(PackedHandler):
+  def __init__(self, result=None):
+    self.result = ParsedSVG() if result is None else result
+    PackedHandler.__init__(self, self.result.paths.append)
+
+  def metadata(self, data):
+    self.result.metadata = data
+
+# Parses an SVG into a ParsedSVG. Takes the same options as parse().
+def record(text, **options):
+  handler = RecordingHandler()
+  parse(text, handler, **options)
+  return handler.result
+
+# Remembers ParsedSVG results by a hash of the SVG text and parser options, so
+# parsing a document that was seen before is just a replay. Up to "maxSize"
+# results are kept in memory, dropping the least recently used ones first. If
+# "directory" is given, results are also pickled there so they survive a
+# restart. Cached results are shared, so don't modify them. Only the
+# tolerance, simplify, clip and vectorize options are supported.
+class ParseCache:
+  def __init__(self, maxSize=256, directory=None):
+    self.maxSize = maxSize
+    self.directory = directory
+    self.entries = collections.OrderedDict()
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  # Like parse() but replays a cached result when possible
+  def parse(self, text, handler, **options):
+    self.record(text, **options).replay(handler)
+
+  # Like record() but returns a cached result when possible
+  def record(self, text, **options):
+    key = self._key(text, options)
+
+    with self.lock:
+      result = self.entries.pop(key, None)
+      if result is not None:
+        self.entries[key] = result
+        self.hits += 1
+        return result
+
+    result = self._load(key)
+    missed = result is None
+    if missed:
+      result = record(text, **options)
+      self._save(key, result)
+
+    with self.lock:
+      if missed: self.misses += 1
+      else: self.hits += 1
+      self.entries[key] = result
+      while len(self.entries) > self.maxSize:
+        self.entries.popitem(last=False)
+    return result
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+
+  # Only options that are plain values can be part of the key. The others are
+  # objects filled in by the parse, which a replay wouldn't do.
+  def _key(self, text, options):
+    normalized = []
+    for name, value in sorted(options.items()):
+      if name not in ('tolerance', 'simplify', 'clip', 'vectorize'):
+        raise Exception('Unsupported option for ParseCache: %s' % repr(name))
+      if name == 'vectorize' or value is None:
+        continue # Doesn't change the result
+      normalized.append((name, tuple(map(float, value)) if name == 'clip' else float(value)))
+    digest = hashlib.sha1(text.encode('utf8') if not isinstance(text, bytes) else text)
+    digest.update(repr(normalized).encode('utf8'))
+    return digest.hexdigest()
+
+  def _load(self, key):
+    if not self.directory:
+      return None
+    try:
+      with open(os.path.join(self.directory, key + '.pickle'), 'rb') as f:
+        return pickle.load(f)
+    except Exception:
+      return None
+
+  # Like _load(), failures are ignored since the result is still good. Another
+  # worker may have saved the same key already, which os.rename() doesn't
+  # allow on Windows, so os.replace() is used where it exists.
+  def _save(self, key, result):
+    if not self.directory:
+      return
+    temp = None
+    try:
+      fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+      with os.fdopen(fd, 'wb') as f:
+        pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+      getattr(os, 'replace', os.rename)(temp, os.path.join(self.directory, key + '.pickle'))
+    except Exception:
+      if temp is not None:
+        try:
+          os.remove(temp)
+        except OSError:
+          pass
+
+# Pass this to parse() as the "geometryCache" option so that each distinct
+# path, polygon, rect, circle and so on is only parsed once. Outlines are
+# keyed on the tag name and geometry attributes exactly as written and stored
+# untransformed, then replayed through the transform of every element that
+# uses them. Share one object between parses to reuse outlines across
+# documents. Once the outlines take more than about "maxBytes", the least
+# recently used ones are dropped.
+class GeometryCache:
+  def __init__(self, maxBytes=16 << 20):
+    self.maxBytes = maxBytes
+    self.entries = collections.OrderedDict()
+    self.lock = threading.Lock()
+    self.bytes = 0
+    self.hits = 0
+    self.misses = 0
+
+  # Returns the PackedPath stored for "key", or None
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.pop(key, None)
+      if entry is None:
+        self.misses += 1
+        return None
+      self.entries[key] = entry
+      self.hits += 1
+      return entry[0]
+
+  def put(self, key, path):
+    size = 100 + sum(len(part) for part in key if part) + \
+      len(path.commands) * path.commands.itemsize + len(path.coords) * path.coords.itemsize
+    with self.lock:
+      old = self.entries.pop(key, None)
+      if old is not None:
+        self.bytes -= old[1]
+      self.entries[key] = (path, size)
+      self.bytes += size
+      while self.bytes > self.maxBytes and self.entries:
+        self.bytes -= self.entries.popitem(last=False)[1][1]
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+      self.bytes = 0
+
+# A compact binary format for flattened geometry. All numbers are little-endian
+# and each section starts at a multiple of 8 bytes from the start of the file:
+#
+#   header    magic "SVGB", uint16 version (1), uint16 flags, uint32 counts of
+#             paths, commands, coordinates and styles, then float64 width and
+#             height. Flags: 1 = coordinates are float32 instead of float64,
+#             2 = has width, 4 = has height.
+#   styles    five float64s (r, g, b, a, width) per style, width is 0 for fills
+#             and r, g, b are whole numbers from 0 to 255
+#   paths     three int32s per path: the index just past its last command and
+#             the style indices of its fill and stroke (-1 for none)
+#   commands  one uint8 per command, using the PackedPath codes
+#   coords    the points used by the commands, in order
+#
+# Pass a BinaryWriter to parse() to produce this format and use BinaryGeometry
+# or load_binary() to read it back.
+_BINARY_MAGIC = b'SVGB'
+_BINARY_HEADER = struct.Struct('<4sHHIIIIdd')
+_BINARY_FLOAT32 = 1
+_BINARY_HAS_WIDTH = 2
+_BINARY_HAS_HEIGHT = 4
+
+# Pass this to parse() to collect geometry in the binary format above, then
+# call getvalue() or write(). Coordinates are stored as float32 unless
+# "doublePrecision" is set.
+class BinaryWriter(HandlerInterface):
+  def __init__(self, doublePrecision=False):
+    self.data = {}
+    self.doublePrecision = doublePrecision
+    self.commands = array.array('B')
+    self.coords = array.array('d' if doublePrecision else 'f')
+    self.paths = array.array('i')
+    self.styles = array.array('d')
+    self.styleIndices = {}
+    self.fillStyle = -1
+    self.strokeStyle = -1
+
+  def metadata(self, data):
+    self.data = data
+
+  def beginPath(self):
+    self.fillStyle = -1
+    self.strokeStyle = -1
+
+  def moveTo(self, x, y):
+    self.commands.append(MOVE_TO)
+    self.coords.extend((x, y))
+
+  def lineTo(self, x, y):
+    self.commands.append(LINE_TO)
+    self.coords.extend((x, y))
+
+  def curveTo(self, x1, y1, x2, y2, x3, y3):
+    self.commands.append(CURVE_TO)
+    self.coords.extend((x1, y1, x2, y2, x3, y3))
+
+  def closePath(self):
+    self.commands.append(CLOSE_PATH)
+
+  def fill(self, r, g, b, a):
+    self.fillStyle = self._style((r, g, b, a, 0.0))
+
+  def stroke(self, r, g, b, a, width):
+    self.strokeStyle = self._style((r, g, b, a, width))
+
+  def endPath(self):
+    self.paths.extend((len(self.commands), self.fillStyle, self.strokeStyle))
+
+  def getvalue(self):
+    flags = 0
+    if not self.doublePrecision: flags |= _BINARY_FLOAT32
+    if 'width' in self.data: flags |= _BINARY_HAS_WIDTH
+    if 'height' in self.data: flags |= _BINARY_HAS_HEIGHT
+    parts = [_BINARY_HEADER.pack(_BINARY_MAGIC, 1, flags, len(self.paths) // 3, len(self.commands),
+      len(self.coords), len(self.styles) // 5, self.data.get('width', 0), self.data.get('height', 0))]
+    for section in [self.styles, self.paths, self.commands, self.coords]:
+      parts.append(_array_bytes(section))
+      parts.append(b'\0' * (-len(parts[-1]) % 8))
+    return b''.join(parts)
+
+  def write(self, fileobj):
+    fileobj.write(self.getvalue())
+
+  def _style(self, style):
+    index = self.styleIndices.get(style)
+    if index is None:
+      index = self.styleIndices[style] = len(self.styles) // 5
+      self.styles.extend(style)
+    return index
+
+# Reads the binary format written by BinaryWriter from anything supporting the
+# buffer protocol. Nothing is decoded up front: the arrays are views into the
+# buffer, so only the parts that are replayed are ever touched.
+class BinaryGeometry:
+  def __init__(self, buffer):
+    magic, version, flags, pathCount, commandCount, coordCount, styleCount, width, height = \
+      _BINARY_HEADER.unpack_from(buffer, 0)
+    if magic != _BINARY_MAGIC or version != 1:
+      raise Exception('Unsupported binary geometry format')
+
+    self.buffer = buffer
+    self.metadata = None
+    if flags & (_BINARY_HAS_WIDTH | _BINARY_HAS_HEIGHT):
+      self.metadata = {}
+      if flags & _BINARY_HAS_WIDTH: self.metadata['width'] = width
+      if flags & _BINARY_HAS_HEIGHT: self.metadata['height'] = height
+
+    offset = _BINARY_HEADER.size + (-_BINARY_HEADER.size % 8)
+    sections = []
+    for typecode, count in [('d', styleCount * 5), ('i', pathCount * 3), ('B', commandCount),
+        ('f' if flags & _BINARY_FLOAT32 else 'd', coordCount)]:
+      sections.append(_buffer_view(buffer, offset, typecode, count))
+      size = array.array(typecode).itemsize * count
+      offset += size + (-size % 8)
+    self.styles, self.paths, self.commands, self.coords = sections
+
+  def __len__(self):
+    return len(self.paths) // 3
+
+  # Sends the stored geometry to a HandlerInterface, like ParsedSVG.replay()
+  def replay(self, handler, matrix=None):
+    coords = self.coords
+    strokeScale = 1
+    if matrix:
+      m = _replay_matrix(matrix)
+      if not m.identity:
+        coords = _transform_coords(coords, m)
+        strokeScale = _stroke_scale(m)
+
+    if self.metadata is not None:
+      handler.metadata(dict(self.metadata))
+
+    # Color channels are stored as floats but the parser always produces ints
+    styles = [(int(r), int(g), int(b), a, width) for r, g, b, a, width in zip(*[iter(self.styles)] * 5)]
+    paths = self.paths
+    start = 0
+    i = 0
+    for p in range(0, len(paths), 3):
+      end, fill, stroke = paths[p], paths[p + 1], paths[p + 2]
+      i = _replay_path(handler, self.commands[start:end], coords, i,
+        styles[fill][:4] if fill >= 0 else None,
+        styles[stroke] if stroke >= 0 else None,
+        strokeScale)
+      start = end
+
+# Memory-maps a file written by BinaryWriter and returns a BinaryGeometry
+def load_binary(path):
+  with open(path, 'rb') as f:
+    return BinaryGeometry(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+# A compact format for sending geometry over a network, trading a little
+# precision for size. Every point is rounded to a multiple of "grid" output
+# pixels and stored as its distance from the previous point of the same path,
+# so most numbers fit in one or two bytes:
+#
+#   header   magic "SVGQ", uint8 version (1), float64 grid
+#   records  one uint8 opcode each, followed by its arguments:
+#            0-2  a PackedPath command code followed by its points, each as
+#                 varint x and y differences from the previous point (the
+#                 first point of each path is relative to 0, 0)
+#            3    closePath()
+#            4    fill, with the varint index of a style
+#            5    stroke, with the varint index of a style
+#            6    end of path
+#            7    a new style: uint8 r, g, b (clamped to 0-255), float64 a and
+#                 width (0 for fills)
+#            8    metadata: uint8 flags (1 = width, 2 = height) followed by
+#                 float64 width and height if present
+#
+# Varints store signed numbers as 0, -1, 1, -2, ... = 0, 1, 2, 3, ... in
+# groups of 7 bits, lowest first, with the top bit set on all but the last.
+# Numbers are little-endian. Records can be sent as soon as they're written
+# since nothing refers forward.
+_QUANTIZED_MAGIC = b'SVGQ'
+_QUANTIZED_HEADER = struct.Struct('<4sBd')
+_QUANTIZED_STYLE = struct.Struct('<BBBdd')
+_QUANTIZED_FILL = 4
+_QUANTIZED_STROKE = 5
+_QUANTIZED_END_PATH = 6
+_QUANTIZED_NEW_STYLE = 7
+_QUANTIZED_METADATA = 8
+
+# Pass this to parse() to collect geometry in the quantized format above, then
+# call getvalue() or write(). "grid" is the spacing of the points that
+# coordinates are rounded to in output pixels, so decoded points are off by
+# at most half of it.
+class QuantizedWriter(HandlerInterface):
+  def __init__(self, grid=1.0 / 64):
+    if not grid > 0: raise Exception('Invalid grid: %s' % repr(grid))
+    self.grid = grid
+    self.scale = 1.0 / grid
+    self.data = bytearray(_QUANTIZED_HEADER.pack(_QUANTIZED_MAGIC, 1, grid))
+    self.styleIndices = {}
+    self.x = self.y = 0
+
+  def metadata(self, data):
+    flags = 0
+    values = []
+    if 'width' in data:
+      flags |= 1
+      values.append(data['width'])
+    if 'height' in data:
+      flags |= 2
+      values.append(data['height'])
+    self.data.extend((_QUANTIZED_METADATA, flags))
+    self.data.extend(struct.pack('<%dd' % len(values), *values))
+
+  def beginPath(self):
+    self.x = self.y = 0
+
+  def moveTo(self, x, y):
+    self.data.append(MOVE_TO)
+    self._points((x, y))
+
+  def lineTo(self, x, y):
+    self.data.append(LINE_TO)
+    self._points((x, y))
+
+  def curveTo(self, x1, y1, x2, y2, x3, y3):
+    self.data.append(CURVE_TO)
+    self._points((x1, y1, x2, y2, x3, y3))
+
+  def closePath(self):
+    self.data.append(CLOSE_PATH)
+
+  def fill(self, r, g, b, a):
+    index = self._style((r, g, b, a, 0.0))
+    self.data.append(_QUANTIZED_FILL)
+    _write_varint(self.data, index)
+
+  def stroke(self, r, g, b, a, width):
+    index = self._style((r, g, b, a, width))
+    self.data.append(_QUANTIZED_STROKE)
+    _write_varint(self.data, index)
+
+  def endPath(self):
+    self.data.append(_QUANTIZED_END_PATH)
+
+  def getvalue(self):
+    return bytes(self.data)
+
+  def write(self, fileobj):
+    fileobj.write(self.data)
+
+  # Color channels are stored as bytes, so ones outside 0-255 (which rgb()
+  # allows) are clamped like a renderer would
+  def _style(self, style):
+    r, g, b, a, width = style
+    style = (min(max(r, 0), 255), min(max(g, 0), 255), min(max(b, 0), 255), a, width)
+    index = self.styleIndices.get(style)
+    if index is None:
+      index = self.styleIndices[style] = len(self.styleIndices)
+      self.data.append(_QUANTIZED_NEW_STYLE)
+      self.data.extend(_QUANTIZED_STYLE.pack(*style))
+    return index
+
+  # Appends the differences between successive points, rounded to the grid.
+  # This is the hot loop, so the varint encoding is inlined.
+  def _points(self, coords):
+    data = self.data
+    scale = self.scale
+    x, y = self.x, self.y
+    for i in range(0, len(coords), 2):
+      qx = int(round(coords[i] * scale))
+      qy = int(round(coords[i + 1] * scale))
+      for d in (qx - x, qy - y):
+        d = d << 1 if d >= 0 else ~d << 1 | 1
+        while d > 0x7f:
+          data.append(d & 0x7f | 0x80)
+          d >>= 7
+        data.append(d)
+      x, y = qx, qy
+    self.x, self.y = x, y
+
+# Reads the quantized format written by QuantizedWriter from bytes (or
+# anything else supporting the buffer protocol)
+class QuantizedGeometry:
+  def __init__(self, buffer):
+    magic, version, grid = _QUANTIZED_HEADER.unpack_from(buffer, 0)
+    if magic != _QUANTIZED_MAGIC or version != 1:
+      raise Exception('Unsupported quantized geometry format')
+    self.buffer = buffer
+    self.grid = grid
+
+  # Sends the stored geometry to a HandlerInterface, like ParsedSVG.replay()
+  def replay(self, handler, matrix=None):
+    m = None
+    strokeScale = 1
+    if matrix:
+      m = _replay_matrix(matrix)
+      if m.identity:
+        m = None
+      else:
+        strokeScale = _stroke_scale(m)
+
+    data = bytearray(self.buffer)
+    grid = self.grid
+    styles = []
+    commands = array.array('B')
+    coords = []
+    fill = stroke = None
+    x = y = 0
+    i = _QUANTIZED_HEADER.size
+    end = len(data)
+    while i < end:
+      op = data[i]
+      i += 1
+      if op <= CURVE_TO:
+        commands.append(op)
+        for k in range(6 if op == CURVE_TO else 2):
+          d = data[i]
+          if d < 0x80:
+            i += 1
+          else:
+            d, i = _read_varint(data, i)
+          d = ~(d >> 1) if d & 1 else d >> 1
+          if k & 1:
+            y += d
+            coords.append(y * grid)
+          else:
+            x += d
+            coords.append(x * grid)
+      elif op == CLOSE_PATH:
+        commands.append(op)
+      elif op == _QUANTIZED_END_PATH:
+        if m is not None:
+          coords = _transform_coords(coords, m)
+        _replay_path(handler, commands, coords, 0, fill, stroke, strokeScale)
+        commands = array.array('B')
+        coords = []
+        fill = stroke = None
+        x = y = 0
+      elif op == _QUANTIZED_FILL:
+        index, i = _read_varint(data, i)
+        fill = styles[index][:4]
+      elif op == _QUANTIZED_STROKE:
+        index, i = _read_varint(data, i)
+        stroke = styles[index]
+      elif op == _QUANTIZED_NEW_STYLE:
+        styles.append(_QUANTIZED_STYLE.unpack_from(data, i))
+        i += _QUANTIZED_STYLE.size
+      elif op == _QUANTIZED_METADATA:
+        flags = data[i]
+        keys = [key for bit, key in [(1, 'width'), (2, 'height')] if flags & bit]
+        values = struct.unpack_from('<%dd' % len(keys), data, i + 1)
+        handler.metadata(dict(zip(keys, values)))
+        i += 1 + 8 * len(keys)
+      else:
+        raise Exception('Invalid quantized geometry opcode: %s' % repr(op))
+
+# Pass this to parse() as the "bounds" option to collect the bounding box of
+# every path in output space. "paths" gets one (minX, minY, maxX, maxY) tuple
+# per path in drawing order, or None for paths without points, and "box"
+# covers all of them. Boxes are tight around curves but don't include stroke
+# widths. Afterwards, query() finds the paths that touch a rectangle using a
+# uniform grid that's built on first use.
+class Bounds:
+  def __init__(self, cellSize=None):
+    self.paths = []
+    self.box = None
+    self.cellSize = cellSize
+    self.grid = None
+
+  def add(self, box):
+    self.paths.append(box)
+    self.grid = None
+    if box is not None:
+      self.box = box if self.box is None else _union(self.box, box)
+
+  # Returns the indices of the paths whose boxes intersect the rectangle
+  def query(self, minX, minY, maxX, maxY):
+    if self.box is None:
+      return []
+    if self.grid is None:
+      self._buildGrid()
+    size = self.cellSize
+    x0, y0 = self.box[0], self.box[1]
+    found = set()
+    for ix in range(int(math.floor((max(minX, x0) - x0) / size)), int(math.floor((min(maxX, self.box[2]) - x0) / size)) + 1):
+      for iy in range(int(math.floor((max(minY, y0) - y0) / size)), int(math.floor((min(maxY, self.box[3]) - y0) / size)) + 1):
+        found.update(self.grid.get((ix, iy), ()))
+    paths = self.paths
+    return sorted(i for i in found if paths[i][0] <= maxX and paths[i][2] >= minX and paths[i][1] <= maxY and paths[i][3] >= minY)
+
+  # Uses about one cell per path unless a cell size was given
+  def _buildGrid(self):
+    minX, minY, maxX, maxY = self.box
+    if not self.cellSize:
+      count = max(1, sum(1 for box in self.paths if box is not None))
+      self.cellSize = max(maxX - minX, maxY - minY, 1e-9) / math.sqrt(count)
+    size = self.cellSize
+    self.grid = {}
+    for i, box in enumerate(self.paths):
+      if box is None:
+        continue
+      for ix in range(int((box[0] - minX) / size), int((box[2] - minX) / size) + 1):
+        for iy in range(int((box[1] - minY) / size), int((box[3] - minY) / size) + 1):
+          self.grid.setdefault((ix, iy), []).append(i)
+
+# Pass this to parse() as the "stats" option to see where a parse spends its
+# time. "elements" counts elements by tag name, "commands" counts path
+# commands by uppercase letter as they're parsed (so outlines reused from a
+# geometryCache aren't counted again), "segments" counts the moveTo(),
+# lineTo(), curveTo() and closePath() calls the handler got and "colors"
+# counts fill and stroke colors. "timings" has the seconds spent reading the XML ("load"),
+# parsing path data ("paths"), parsing and combining transforms
+# ("transforms"), inside the handler ("handler") and in total ("total"). Path
+# and transform times leave out the handler calls they make. Since
+# parse_stream() reads while it parses, its "load" time is everything that
+# isn't counted elsewhere. Using one object for several parses adds up their
+# numbers, and "callback" is called with asDict() after each of them.
+class Stats:
+  def __init__(self, callback=None):
+    self.callback = callback
+    self.elements = {}
+    self.commands = {}
+    self.segments = {}
+    self.colors = 0
+    self.timings = dict.fromkeys(['load', 'paths', 'transforms', 'handler', 'total'], 0.0)
+
+  def asDict(self):
+    return {
+      'elements': dict(self.elements),
+      'commands': dict(self.commands),
+      'segments': dict(self.segments),
+      'colors': self.colors,
+      'timings': dict(self.timings),
+    }
+
+  def _finish(self, load, total):
+    self.timings['load'] += load
+    self.timings['total'] += total
+    if self.callback is not None:
+      self.callback(self.asDict())
+
+# The outcome of parsing one source with parse_batch(). On failure "error" is
+# a description of the error and nothing else is set.
+class BatchResult(ParsedSVG):
+  def __init__(self):
+    ParsedSVG.__init__(self)
+    self.error = None
+
+# The most precise clock available for Stats timings
+_clock = getattr(time, 'perf_counter', time.time)
 
 # Derivation: http://en.wikipedia.org/wiki/Bezier_spline
 _CIRCLE_APPROXIMATION_CONSTANT = 4.0 / 3.0 * (math.sqrt(2) - 1)
@@ -184,21 +1032,56 @@ _align_table = {
   'xMaxYMax': (1.0, 1.0),
 }
 
-class _Vector:
-  def __init__(self, x, y):
-    self.x = x
-    self.y = y
-
-  def __add__(self, v):
-    return _Vector(self.x + v.x, self.y + v.y)
+# The letter "e" is left out because it's part of the number syntax
+_PATH_SEGMENT = re.compile(r'([A-DF-Za-df-z])([^A-DF-Za-df-z]*)')
+_NUMBER_PATTERN = r'[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?'
+_PATH_NUMBER = re.compile(_NUMBER_PATTERN + r'|[^\s,]')
+
+_ARC_ARGUMENTS = re.compile(r'[\s,]*({0})[\s,]*({0})[\s,]*({0})[\s,]*([01])[\s,]*([01])[\s,]*({0})[\s,]*({0})'.format(_NUMBER_PATTERN))
+
+_TRANSFORM = re.compile(r'(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)[\s,]*')
+
+_COLOR_HEX6 = re.compile(r'^#[A-Fa-f0-9]{6}$')
+_COLOR_HEX3 = re.compile(r'^#[A-Fa-f0-9]{3}$')
+_COLOR_RGB = re.compile(r'^rgb\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*\)$')
+_COLOR_RGBA = re.compile(r'^rgba\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+(?:\.\d+)?|\.\d+)\s*\)$')
+
+# Fewer coordinates than this are transformed without NumPy, which has more
+# overhead per call than it saves on short runs
+_VECTORIZE_MIN_COORDS = 64
+
+# Curves are never split into more lines than this
+_FLATTEN_MAX_LINES = 10000
+
+# The attributes that make up the outline of each kind of shape, which are
+# used as GeometryCache keys
+_geometry_attributes = {
+  'path': ('d',),
+  'rect': ('x', 'y', 'width', 'height', 'rx', 'ry'),
+  'line': ('x1', 'y1', 'x2', 'y2'),
+  'circle': ('cx', 'cy', 'r'),
+  'ellipse': ('cx', 'cy', 'rx', 'ry'),
+  'polyline': ('points',),
+  'polygon': ('points',),
+}
 
-  def __sub__(self, v):
-    return _Vector(self.x - v.x, self.y - v.y)
+# How many numbers each path command consumes per repetition
+_path_arity = {
+  'M': 2,
+  'L': 2,
+  'H': 1,
+  'V': 1,
+  'Q': 4,
+  'T': 2,
+  'C': 6,
+  'S': 4,
+  'A': 7,
+  'Z': 0,
+}
 
-  def __mul__(self, n):
-    return _Vector(self.x * n, self.y * n)
+class _Matrix(object):
+  __slots__ = ['m00', 'm01', 'm02', 'm10', 'm11', 'm12', 'identity']
 
-class _Matrix:
   def __init__(self, m00=1, m01=0, m02=0, m10=0, m11=1, m12=0):
     self.m00 = m00
     self.m01 = m01
@@ -206,6 +1089,7 @@ class _Matrix:
     self.m10 = m10
     self.m11 = m11
     self.m12 = m12
+    self.identity = m00 == 1 and m01 == 0 and m02 == 0 and m10 == 0 and m11 == 1 and m12 == 0
 
   def multiply(self, other):
     return _Matrix(
@@ -216,59 +1100,366 @@ class _Matrix:
       self.m10 * other.m01 + self.m11 * other.m11,
       self.m10 * other.m02 + self.m11 * other.m12 + self.m12)
 
-  def transform(self, v):
-    return _Vector(
-      self.m00 * v.x + self.m01 * v.y + self.m02,
-      self.m10 * v.x + self.m11 * v.y + self.m12)
+  def transform(self, x, y):
+    return (
+      self.m00 * x + self.m01 * y + self.m02,
+      self.m10 * x + self.m11 * y + self.m12)
 
-class _Parser:
+# Base class for stages between the parser and the handler, which see the
+# output after it has been transformed. Calls are passed through unchanged
+# unless overridden.
+class _HandlerFilter(HandlerInterface):
   def __init__(self, handler):
+    self.handler = handler
+    self.handlerEndPath = getattr(handler, 'endPath', None)
+
+  def metadata(self, data): self.handler.metadata(data)
+  def beginPath(self): self.handler.beginPath()
+  def moveTo(self, x, y): self.handler.moveTo(x, y)
+  def lineTo(self, x, y): self.handler.lineTo(x, y)
+  def curveTo(self, x1, y1, x2, y2, x3, y3): self.handler.curveTo(x1, y1, x2, y2, x3, y3)
+  def closePath(self): self.handler.closePath()
+  def fill(self, r, g, b, a): self.handler.fill(r, g, b, a)
+  def stroke(self, r, g, b, a, width): self.handler.stroke(r, g, b, a, width)
+
+  def endPath(self):
+    if self.handlerEndPath:
+      self.handlerEndPath()
+
+# Replaces curves with as few line segments as possible while staying within
+# "tolerance" of the curve. This happens in output space, so the tolerance is
+# in output pixels no matter how the curve was transformed.
+class _Flattener(_HandlerFilter):
+  def __init__(self, handler, tolerance):
+    _HandlerFilter.__init__(self, handler)
+    self.tolerance = tolerance
+    self.x = self.y = self.startX = self.startY = 0
+
+  def moveTo(self, x, y):
+    self.x = self.startX = x
+    self.y = self.startY = y
+    self.handler.moveTo(x, y)
+
+  def lineTo(self, x, y):
+    self.x = x
+    self.y = y
+    self.handler.lineTo(x, y)
+
+  def curveTo(self, x1, y1, x2, y2, x3, y3):
+    _flatten_cubic(self.x, self.y, x1, y1, x2, y2, x3, y3, self.tolerance, self.handler.lineTo)
+    self.x = x3
+    self.y = y3
+
+  def closePath(self):
+    self.x = self.startX
+    self.y = self.startY
+    self.handler.closePath()
+
+# Simplifies each run of consecutive lineTo() calls with the Ramer-Douglas-
+# Peucker algorithm, keeping the first and last point of the run and only as
+# many points in between as needed to stay within "tolerance" of all of them.
+# Runs are collected in output space and end at any other call, so curves and
+# the starts and ends of subpaths are never moved.
+class _Simplifier(_HandlerFilter):
+  def __init__(self, handler, tolerance):
+    _HandlerFilter.__init__(self, handler)
+    self.tolerance = tolerance
+    self.points = [0, 0]
+    self.startX = self.startY = 0
+
+  def beginPath(self):
+    self.flush()
+    self.handler.beginPath()
+
+  def moveTo(self, x, y):
+    self.flush()
+    self.points = [x, y]
+    self.startX = x
+    self.startY = y
+    self.handler.moveTo(x, y)
+
+  def lineTo(self, x, y):
+    self.points.append(x)
+    self.points.append(y)
+
+  def curveTo(self, x1, y1, x2, y2, x3, y3):
+    self.flush()
+    self.points = [x3, y3]
+    self.handler.curveTo(x1, y1, x2, y2, x3, y3)
+
+  def closePath(self):
+    self.flush()
+    self.points = [self.startX, self.startY]
+    self.handler.closePath()
+
+  def fill(self, r, g, b, a):
+    self.flush()
+    self.handler.fill(r, g, b, a)
+
+  def stroke(self, r, g, b, a, width):
+    self.flush()
+    self.handler.stroke(r, g, b, a, width)
+
+  def endPath(self):
+    self.flush()
+    _HandlerFilter.endPath(self)
+
+  # Sends the pending run of lines, leaving its last point as the start of
+  # the next one
+  def flush(self):
+    points = self.points
+    if len(points) == 2:
+      return
+    lineTo = self.handler.lineTo
+    if len(points) == 4:
+      lineTo(points[2], points[3])
+    else:
+      for i in _simplify_polyline(points, self.tolerance)[1:]:
+        lineTo(points[2 * i], points[2 * i + 1])
+    self.points = points[-2:]
+
+# Measures the exact bounding box of each path, including the extremes of
+# curves rather than just their control points, and adds it to a Bounds
+class _BoundsTracker(_HandlerFilter):
+  def __init__(self, handler, bounds):
+    _HandlerFilter.__init__(self, handler)
+    self.bounds = bounds
+    self.box = None
+    self.x = self.y = self.startX = self.startY = 0
+
+  def beginPath(self):
+    self.box = None
+    self.handler.beginPath()
+
+  def moveTo(self, x, y):
+    self.x = self.startX = x
+    self.y = self.startY = y
+    self.include(x, y, x, y)
+    self.handler.moveTo(x, y)
+
+  def lineTo(self, x, y):
+    self.x = x
+    self.y = y
+    self.include(x, y, x, y)
+    self.handler.lineTo(x, y)
+
+  def curveTo(self, x1, y1, x2, y2, x3, y3):
+    minX, maxX = _cubic_extent(self.x, x1, x2, x3)
+    minY, maxY = _cubic_extent(self.y, y1, y2, y3)
+    self.include(minX, minY, maxX, maxY)
+    self.x = x3
+    self.y = y3
+    self.handler.curveTo(x1, y1, x2, y2, x3, y3)
+
+  def closePath(self):
+    self.x = self.startX
+    self.y = self.startY
+    self.handler.closePath()
+
+  def endPath(self):
+    self.bounds.add(self.box)
+    self.box = None
+    _HandlerFilter.endPath(self)
+
+  def include(self, minX, minY, maxX, maxY):
+    box = self.box
+    self.box = (minX, minY, maxX, maxY) if box is None else (
+      min(box[0], minX), min(box[1], minY), max(box[2], maxX), max(box[3], maxY))
+
+# Drops paths that are entirely outside the "clip" rectangle. Each path is
+# packed and measured before it's passed on, and is only replayed to the
+# handler if its box touches the rectangle. Boxes are grown by twice the
+# stroke width to cover miter joins up to the default miter limit. "onBox" is
+# called with the box of every path, drawn or not.
+class _Culler(_BoundsTracker):
+  def __init__(self, handler, clip, onBox):
+    _BoundsTracker.__init__(self, PackedHandler(self.emit), self)
+    self.target = handler
+    self.clip = clip
+    self.onBox = onBox
+    self.last = None
+
+  def metadata(self, data):
+    self.target.metadata(data)
+
+  # Called by _BoundsTracker.endPath() just before the path is packed
+  def add(self, box):
+    self.last = box
+
+  def emit(self, path):
+    box = self.last
+    if box is not None and path.stroke:
+      pad = path.stroke[4] * 2
+      box = (box[0] - pad, box[1] - pad, box[2] + pad, box[3] + pad)
+    self.onBox(box)
+    if box is not None and _intersects(box, self.clip):
+      _replay_path(self.target, path.commands, path.coords, 0, path.fill, path.stroke, 1)
+
+# Times every handler call and counts the ones that draw, for Stats
+class _StatsRecorder(_HandlerFilter):
+  def __init__(self, handler, stats):
+    _HandlerFilter.__init__(self, handler)
+    self.timings = stats.timings
+    self.segments = stats.segments
+
+  def metadata(self, data):
+    start = _clock()
+    self.handler.metadata(data)
+    self.timings['handler'] += _clock() - start
+
+  def beginPath(self):
+    start = _clock()
+    self.handler.beginPath()
+    self.timings['handler'] += _clock() - start
+
+  def moveTo(self, x, y):
+    start = _clock()
+    self.handler.moveTo(x, y)
+    self.finish('moveTo', start)
+
+  def lineTo(self, x, y):
+    start = _clock()
+    self.handler.lineTo(x, y)
+    self.finish('lineTo', start)
+
+  def curveTo(self, x1, y1, x2, y2, x3, y3):
+    start = _clock()
+    self.handler.curveTo(x1, y1, x2, y2, x3, y3)
+    self.finish('curveTo', start)
+
+  def closePath(self):
+    start = _clock()
+    self.handler.closePath()
+    self.finish('closePath', start)
+
+  def fill(self, r, g, b, a):
+    start = _clock()
+    self.handler.fill(r, g, b, a)
+    self.timings['handler'] += _clock() - start
+
+  def stroke(self, r, g, b, a, width):
+    start = _clock()
+    self.handler.stroke(r, g, b, a, width)
+    self.timings['handler'] += _clock() - start
+
+  def endPath(self):
+    start = _clock()
+    _HandlerFilter.endPath(self)
+    self.timings['handler'] += _clock() - start
+
+  def finish(self, name, start):
+    self.timings['handler'] += _clock() - start
+    self.segments[name] = self.segments.get(name, 0) + 1
+
+class _Parser:
+  def __init__(self, handler, tolerance=None, simplify=None, bounds=None, clip=None, clipCache=None, stats=None, geometryCache=None, vectorize=False):
+    if stats is not None:
+      handler = _StatsRecorder(handler, stats)
+    if tolerance is not None:
+      if not tolerance > 0: raise Exception('The tolerance must be positive: %s' % repr(tolerance))
+      handler = _Flattener(handler, tolerance)
+    if simplify is not None:
+      if not simplify > 0: raise Exception('The simplify tolerance must be positive: %s' % repr(simplify))
+      handler = _Simplifier(handler, simplify)
+    if bounds is not None:
+      handler = _BoundsTracker(handler, bounds)
+    if clip is not None:
+      if len(clip) != 4: raise Exception('The clip must be (minX, minY, maxX, maxY): %s' % repr(clip))
+      handler = _Culler(handler, tuple(clip), self.includeBox)
+
     self.matrix = _Matrix()
     self.handler = handler
-    self.cursor = _Vector(0, 0)
+    self.cursorX = 0
+    self.cursorY = 0
     self.strokeScale = 1
     self.opacity = 1
-
-  def moveTo(self, p):
-    self.cursor = p
-    p = self.matrix.transform(p)
-    self.handler.moveTo(p.x, p.y)
-
-  def lineTo(self, p):
-    self.cursor = p
-    p = self.matrix.transform(p)
-    self.handler.lineTo(p.x, p.y)
-
-  def quadraticCurveTo(self, p1, p2):
-    c1 = self.cursor + (p1 - self.cursor) * (2.0 / 3.0)
-    c2 = p2 + (p1 - p2) * (2.0 / 3.0)
-    self.cursor = p2
-    self.cubicCurveTo(c1, c2, p2)
-
-  def cubicCurveTo(self, p1, p2, p3):
-    self.cursor = p3
-    p1 = self.matrix.transform(p1)
-    p2 = self.matrix.transform(p2)
-    p3 = self.matrix.transform(p3)
-    self.handler.curveTo(p1.x, p1.y, p2.x, p2.y, p3.x, p3.y)
+    self.stack = []
+    self.handlerEndPath = getattr(handler, 'endPath', None)
+
+    # Elements inside <defs> and <symbol> aren't drawn, only instanced by <use>.
+    # The geometry for each referenced element is recorded once in "instances"
+    # and replayed for every <use>. Referenced elements come from "lookup",
+    # which returns (tagName, attrs, children) tuples. By default it looks in
+    # "definitions", which is filled in from <defs> and <symbol> contents as
+    # they go by while "captured" is a list (the stack of open elements).
+    self.hidden = False
+    self.definitions = {}
+    self.lookup = self.definitions.get
+    self.captured = None
+    self.instances = {}
+    self.using = set()
+
+    # With a clip, "box" collects the bounds of the paths drawn by the current
+    # element and its children. Elements are numbered in document order, and
+    # "clipCache" maps each number to the element's box and how many elements
+    # are inside it. An element whose cached box is outside the clip is
+    # "culled" along with everything inside it, and "skipCount" tells visit()
+    # how many elements it can jump over.
+    self.clip = clip
+    self.clipCache = clipCache
+    self.clipStack = []
+    self.ordinal = 0
+    self.box = None
+    self.culled = False
+    self.skipCount = None
+    self.stats = stats
+    self.geometryCache = geometryCache
+    self.vectorize = bool(vectorize) and _numpy() is not None
+
+  # These take untransformed points as separate numbers instead of objects to
+  # avoid allocations, and skip the transform entirely for identity matrices
+  def moveTo(self, x, y):
+    self.cursorX = x
+    self.cursorY = y
+    m = self.matrix
+    if m.identity: self.handler.moveTo(x, y)
+    else: self.handler.moveTo(m.m00 * x + m.m01 * y + m.m02, m.m10 * x + m.m11 * y + m.m12)
+
+  def lineTo(self, x, y):
+    self.cursorX = x
+    self.cursorY = y
+    m = self.matrix
+    if m.identity: self.handler.lineTo(x, y)
+    else: self.handler.lineTo(m.m00 * x + m.m01 * y + m.m02, m.m10 * x + m.m11 * y + m.m12)
+
+  def quadraticCurveTo(self, x1, y1, x2, y2):
+    x0 = self.cursorX
+    y0 = self.cursorY
+    self.cubicCurveTo(
+      x0 + (x1 - x0) * (2.0 / 3.0), y0 + (y1 - y0) * (2.0 / 3.0),
+      x2 + (x1 - x2) * (2.0 / 3.0), y2 + (y1 - y2) * (2.0 / 3.0),
+      x2, y2)
+
+  def cubicCurveTo(self, x1, y1, x2, y2, x3, y3):
+    self.cursorX = x3
+    self.cursorY = y3
+    m = self.matrix
+    if m.identity:
+      self.handler.curveTo(x1, y1, x2, y2, x3, y3)
+    else:
+      m00, m01, m02, m10, m11, m12 = m.m00, m.m01, m.m02, m.m10, m.m11, m.m12
+      self.handler.curveTo(
+        m00 * x1 + m01 * y1 + m02, m10 * x1 + m11 * y1 + m12,
+        m00 * x2 + m01 * y2 + m02, m10 * x2 + m11 * y2 + m12,
+        m00 * x3 + m01 * y3 + m02, m10 * x3 + m11 * y3 + m12)
 
   def outlineEllipse(self, cx, cy, rx, ry):
     crx = rx * _CIRCLE_APPROXIMATION_CONSTANT
     cry = ry * _CIRCLE_APPROXIMATION_CONSTANT
     self.handler.beginPath()
-    self.moveTo(_Vector(cx - rx, cy))
-    self.cubicCurveTo(_Vector(cx - rx, cy - cry), _Vector(cx - crx, cy - ry), _Vector(cx, cy - ry))
-    self.cubicCurveTo(_Vector(cx + crx, cy - ry), _Vector(cx + rx, cy - cry), _Vector(cx + rx, cy))
-    self.cubicCurveTo(_Vector(cx + rx, cy + cry), _Vector(cx + crx, cy + ry), _Vector(cx, cy + ry))
-    self.cubicCurveTo(_Vector(cx - crx, cy + ry), _Vector(cx - rx, cy + cry), _Vector(cx - rx, cy))
+    self.moveTo(cx - rx, cy)
+    self.cubicCurveTo(cx - rx, cy - cry, cx - crx, cy - ry, cx, cy - ry)
+    self.cubicCurveTo(cx + crx, cy - ry, cx + rx, cy - cry, cx + rx, cy)
+    self.cubicCurveTo(cx + rx, cy + cry, cx + crx, cy + ry, cx, cy + ry)
+    self.cubicCurveTo(cx - crx, cy + ry, cx - rx, cy + cry, cx - rx, cy)
     self.handler.closePath()
 
   def outlineRect(self, x, y, w, h):
     self.handler.beginPath()
-    self.moveTo(_Vector(x, y))
-    self.lineTo(_Vector(x + w, y))
-    self.lineTo(_Vector(x + w, y + h))
-    self.lineTo(_Vector(x, y + h))
+    self.moveTo(x, y)
+    self.lineTo(x + w, y)
+    self.lineTo(x + w, y + h)
+    self.lineTo(x, y + h)
     self.handler.closePath()
 
   def outlineRoundedRect(self, x, y, w, h, rx, ry):
@@ -277,77 +1468,125 @@ class _Parser:
     crx = rx * (1 - _CIRCLE_APPROXIMATION_CONSTANT)
     cry = ry * (1 - _CIRCLE_APPROXIMATION_CONSTANT)
     self.handler.beginPath()
-    self.moveTo(_Vector(x + rx, y))
-    self.lineTo(_Vector(x + w - rx, y))
-    self.cubicCurveTo(_Vector(x + w - crx, y), _Vector(x + w, y + cry), _Vector(x + w, y + ry))
-    self.lineTo(_Vector(x + w, y + h - ry))
-    self.cubicCurveTo(_Vector(x + w, y + h - cry), _Vector(x + w - crx, y + h), _Vector(x + w - rx, y + h))
-    self.lineTo(_Vector(x + rx, y + h))
-    self.cubicCurveTo(_Vector(x + crx, y + h), _Vector(x, y + h - cry), _Vector(x, y + h - ry))
-    self.lineTo(_Vector(x, y + ry))
-    self.cubicCurveTo(_Vector(x, y + cry), _Vector(x + crx, y), _Vector(x + rx, y))
+    self.moveTo(x + rx, y)
+    self.lineTo(x + w - rx, y)
+    self.cubicCurveTo(x + w - crx, y, x + w, y + cry, x + w, y + ry)
+    self.lineTo(x + w, y + h - ry)
+    self.cubicCurveTo(x + w, y + h - cry, x + w - crx, y + h, x + w - rx, y + h)
+    self.lineTo(x + rx, y + h)
+    self.cubicCurveTo(x + crx, y + h, x, y + h - cry, x, y + h - ry)
+    self.lineTo(x, y + ry)
+    self.cubicCurveTo(x, y + cry, x + crx, y, x + rx, y)
     self.handler.closePath()
 
-  def visitPath(self, node, style):
+  def visitPath(self, attrs, style):
+    self.outline('path', attrs, self.shapePath)
+    self.fillAndStroke(attrs, style)
+
+  def visitRect(self, attrs, style):
+    self.outline('rect', attrs, self.shapeRect)
+    self.fillAndStroke(attrs, style)
+
+  def visitLine(self, attrs, style):
+    self.outline('line', attrs, self.shapeLine)
+    self.fillAndStroke(attrs, style)
+
+  def visitCircle(self, attrs, style):
+    self.outline('circle', attrs, self.shapeCircle)
+    self.fillAndStroke(attrs, style)
+
+  def visitEllipse(self, attrs, style):
+    self.outline('ellipse', attrs, self.shapeEllipse)
+    self.fillAndStroke(attrs, style)
+
+  def visitPolyline(self, attrs, style):
+    self.outline('polyline', attrs, self.shapePolyline)
+    self.fillAndStroke(attrs, style)
+
+  def visitPolygon(self, attrs, style):
+    self.outline('polygon', attrs, self.shapePolygon)
+    self.fillAndStroke(attrs, style)
+
+  # Draws an element's outline by calling shape(attrs), or with a geometry
+  # cache, by replaying the outline recorded for the same geometry attributes
+  def outline(self, tagName, attrs, shape):
+    cache = self.geometryCache
+    if cache is None:
+      shape(attrs)
+      return
+    key = (tagName,) + tuple(attrs.get(name) for name in _geometry_attributes[tagName])
+    path = cache.get(key)
+    if path is None:
+      path = self.recordOutline(shape, attrs)
+      cache.put(key, path)
     self.handler.beginPath()
-    self._path(_attr(node, 'd'))
-    self.fillAndStroke(node, style)
-
-  def visitRect(self, node, style):
-    x = _units(_attr(node, 'x'))
-    y = _units(_attr(node, 'y'))
-    w = _units(_attr(node, 'width'))
-    h = _units(_attr(node, 'height'))
-    rx = _units(_attr(node, 'rx'))
-    ry = _units(_attr(node, 'ry'))
+    self.replayOutline(path)
+
+  # Returns the untransformed outline drawn by shape(attrs) as a PackedPath
+  def recordOutline(self, shape, attrs):
+    handler, matrix = self.handler, self.matrix
+    recorder = self.handler = PackedHandler(None)
+    self.matrix = _Matrix()
+    try:
+      shape(attrs)
+    finally:
+      self.handler, self.matrix = handler, matrix
+    return recorder.path
+
+  def shapePath(self, attrs):
+    self.handler.beginPath()
+    if self.stats is None: self._path(attrs.get('d'))
+    else: self.timed('paths', self._path, attrs.get('d'))
+
+  def shapeRect(self, attrs):
+    x = _units(attrs.get('x'))
+    y = _units(attrs.get('y'))
+    w = _units(attrs.get('width'))
+    h = _units(attrs.get('height'))
+    rx = _units(attrs.get('rx'))
+    ry = _units(attrs.get('ry'))
     if rx or ry: self.outlineRoundedRect(x, y, w, h, rx, ry)
     else: self.outlineRect(x, y, w, h)
-    self.fillAndStroke(node, style)
 
-  def visitLine(self, node, style):
-    x1 = _units(_attr(node, 'x1'))
-    y1 = _units(_attr(node, 'y1'))
-    x2 = _units(_attr(node, 'x2'))
-    y2 = _units(_attr(node, 'y2'))
+  def shapeLine(self, attrs):
+    x1 = _units(attrs.get('x1'))
+    y1 = _units(attrs.get('y1'))
+    x2 = _units(attrs.get('x2'))
+    y2 = _units(attrs.get('y2'))
     self.handler.beginPath()
-    self.moveTo(_Vector(x1, y1))
-    self.lineTo(_Vector(x2, y2))
-    self.fillAndStroke(node, style)
-
-  def visitCircle(self, node, style):
-    x = _units(_attr(node, 'cx'))
-    y = _units(_attr(node, 'cy'))
-    r = _units(_attr(node, 'r'))
+    self.moveTo(x1, y1)
+    self.lineTo(x2, y2)
+
+  def shapeCircle(self, attrs):
+    x = _units(attrs.get('cx'))
+    y = _units(attrs.get('cy'))
+    r = _units(attrs.get('r'))
     self.outlineEllipse(x, y, r, r)
-    self.fillAndStroke(node, style)
 
-  def visitEllipse(self, node, style):
-    x = _units(_attr(node, 'cx'))
-    y = _units(_attr(node, 'cy'))
-    rx = _units(_attr(node, 'rx'))
-    ry = _units(_attr(node, 'ry'))
+  def shapeEllipse(self, attrs):
+    x = _units(attrs.get('cx'))
+    y = _units(attrs.get('cy'))
+    rx = _units(attrs.get('rx'))
+    ry = _units(attrs.get('ry'))
     self.outlineEllipse(x, y, rx, ry)
-    self.fillAndStroke(node, style)
 
-  def visitPolyline(self, node, style):
+  def shapePolyline(self, attrs):
     self.handler.beginPath()
-    for i, point in enumerate(_points(_attr(node, 'points'))):
-      if i: self.lineTo(point)
-      else: self.moveTo(point)
-    self.fillAndStroke(node, style)
+    for i, (x, y) in enumerate(_points(attrs.get('points'))):
+      if i: self.lineTo(x, y)
+      else: self.moveTo(x, y)
 
-  def visitPolygon(self, node, style):
-    self.handler.beginPath()
-    for i, point in enumerate(_points(_attr(node, 'points'))):
-      if i: self.lineTo(point)
-      else: self.moveTo(point)
+  def shapePolygon(self, attrs):
+    self.shapePolyline(attrs)
     self.handler.closePath()
-    self.fillAndStroke(node, style)
 
-  def fillAndStroke(self, node, style):
-    fill = _attr(node, 'fill') or style.get('fill', 'black')
-    stroke = _attr(node, 'stroke') or style.get('stroke', 'none')
-    strokeWidth = _attr(node, 'stroke-width') or style.get('stroke-width', '1')
+  def fillAndStroke(self, attrs, style):
+    fill = attrs.get('fill') or style.get('fill', 'black')
+    stroke = attrs.get('stroke') or style.get('stroke', 'none')
+    strokeWidth = attrs.get('stroke-width') or style.get('stroke-width', '1')
+
+    if self.stats is not None:
+      self.stats.colors += (fill != 'none') + (stroke != 'none')
 
     if fill != 'none':
       c = _color(fill)
@@ -357,10 +1596,13 @@ class _Parser:
       c = _color(stroke)
       self.handler.stroke(c[0], c[1], c[2], c[3] * self.opacity, self.strokeScale * _units(strokeWidth))
 
-  def visitViewbox(self, node, data):
-    match = re.match(r'^[\s,]*([^\s,]+)[\s,]+([^\s,]+)[\s,]+([^\s,]+)[\s,]+([^\s,]+)[\s,]*$', _attr(node, 'viewBox'))
+    if self.handlerEndPath:
+      self.handlerEndPath()
+
+  def visitViewbox(self, attrs, data):
+    match = re.match(r'^[\s,]*([^\s,]+)[\s,]+([^\s,]+)[\s,]+([^\s,]+)[\s,]+([^\s,]+)[\s,]*$', attrs.get('viewBox'))
     if match:
-      aspect = _attr(node, 'preserveAspectRatio') or 'xMidYMid'
+      aspect = attrs.get('preserveAspectRatio') or 'xMidYMid'
       x, y, w, h = map(_units, match.groups())
       data.setdefault('width', w)
       data.setdefault('height', h)
@@ -374,185 +1616,1059 @@ class _Parser:
       self.matrix = _Matrix(sx, 0, -x * sx, 0, sy, -y * sy)
       self.strokeScale = math.sqrt(sx * sy)
 
-  def visitSVG(self, node):
+  def visitSVG(self, attrs, style):
     data = {}
-    if _attr(node, 'width'): data['width'] = _units(_attr(node, 'width'))
-    if _attr(node, 'height'): data['height'] = _units(_attr(node, 'height'))
-    if _attr(node, 'viewBox'): self.visitViewbox(node, data)
+    if attrs.get('width'): data['width'] = _units(attrs.get('width'))
+    if attrs.get('height'): data['height'] = _units(attrs.get('height'))
+    if attrs.get('viewBox'): self.visitViewbox(attrs, data)
     if data: self.handler.metadata(data)
 
-  def visit(self, node):
+  def visitUse(self, attrs, style):
+    href = attrs.get('xlink:href') or attrs.get('href') or ''
+    if not href.startswith('#'):
+      return
+
+    id = href[1:]
+    paths = self.instances.get(id)
+    if paths is None:
+      element = self.lookup(id)
+      if element is None or id in self.using:
+        return
+      paths = self.instances[id] = self.recordElement(id, element)
+
+    x = _units(attrs.get('x'))
+    y = _units(attrs.get('y'))
     old_matrix = self.matrix
-    old_opacity = self.opacity
-
-    style = _attr(node, 'style') or ''
-    style = dict(tuple(y.strip() for y in x.split(':')) for x in style.split(';') if x)
-    self.opacity *= float(_attr(node, 'opacity') or style.get('opacity', '1'))
-
-    if _attr(node, 'transform'):
-      self.matrix = self.matrix.multiply(_matrix(_attr(node, 'transform')))
-
-    if node.nodeType == node.ELEMENT_NODE:
-      if node.tagName == 'path': self.visitPath(node, style)
-      elif node.tagName == 'rect': self.visitRect(node, style)
-      elif node.tagName == 'line': self.visitLine(node, style)
-      elif node.tagName == 'circle': self.visitCircle(node, style)
-      elif node.tagName == 'ellipse': self.visitEllipse(node, style)
-      elif node.tagName == 'polyline': self.visitPolyline(node, style)
-      elif node.tagName == 'polygon': self.visitPolygon(node, style)
-      elif node.tagName == 'svg': self.visitSVG(node)
-
-    for child in node.childNodes:
-      self.visit(child)
-
+    if x or y: self.matrix = self.matrix.multiply(_Matrix(1, 0, x, 0, 1, y))
+    self.replayPaths(paths)
     self.matrix = old_matrix
-    self.opacity = old_opacity
 
-  def _path(self, data):
-    def next():
-      token = tokens[i[0]]
-      i[0] += 1
-      return token
-
-    def nextX():
-      return float(next()) + (cursor.x if isRelative else 0)
-
-    def nextY():
-      return float(next()) + (cursor.y if isRelative else 0)
-
-    def nextXY():
-      return _Vector(nextX(), nextY())
-
-    def nextIsNumber():
-      return i[0] < len(tokens) and re.match(r'.*\d.*', tokens[i[0]])
-
-    tokens = _tokenize(data)
-    cursor = _Vector(0, 0)
-    delta = None
-    i = [0] # Python 2.7 doesn't have the nonlocal keyword
-
-    while i[0] < len(tokens):
-      command = next()
-      isRelative = command == command.lower()
-      do_while = True
-
-      if command in 'Mm':
-        cursor = nextXY()
-        self.moveTo(cursor)
-        while nextIsNumber():
-          cursor = nextXY()
-          self.lineTo(cursor)
-        delta = None
-
-      elif command in 'Ll':
-        while do_while:
-          cursor = nextXY()
-          self.lineTo(cursor)
-          do_while = nextIsNumber()
-        delta = None
-
-      elif command in 'Hh':
-        while do_while:
-          cursor = _Vector(nextX(), cursor.y)
-          self.lineTo(cursor)
-          do_while = nextIsNumber()
-        delta = None
-
-      elif command in 'Vv':
-        while do_while:
-          cursor = _Vector(cursor.x, nextY())
-          self.lineTo(cursor)
-          do_while = nextIsNumber()
-        delta = None
-
-      elif command in 'Qq':
-        while do_while:
-          cp1 = nextXY()
-          cursor = nextXY()
-          delta = cursor - cp1
-          self.quadraticCurveTo(cp1, cursor)
-          do_while = nextIsNumber()
-
-      elif command in 'Tt':
-        while do_while:
-          cp2 = cursor + delta if delta else cursor
-          cursor = nextXY()
-          delta = cursor - cp2
-          self.quadraticCurveTo(cp2, cursor)
-          do_while = nextIsNumber()
-
-      elif command in 'Cc':
-        while do_while:
-          cp3 = nextXY()
-          cp4 = nextXY()
-          cursor = nextXY()
-          delta = cursor - cp4
-          self.cubicCurveTo(cp3, cp4, cursor)
-          do_while = nextIsNumber()
-
-      elif command in 'Ss':
-        while do_while:
-          cp5 = cursor + delta if delta else cursor
-          cp6 = nextXY()
-          cursor = nextXY()
-          delta = cursor - cp6
-          self.cubicCurveTo(cp5, cp6, cursor)
-          do_while = nextIsNumber()
-
-      elif command in 'Zz':
+  # Returns the untransformed geometry of a referenced element as a list of
+  # PackedPath. A <symbol> is drawn like a <g>.
+  def recordElement(self, id, element):
+    tagName, attrs, children = element
+    recorder = RecordingHandler()
+    parser = _Parser(recorder, vectorize=self.vectorize)
+    parser.lookup = self.lookup
+    parser.instances = self.instances
+    parser.using = self.using
+    parser.geometryCache = self.geometryCache
+    self.using.add(id)
+    try:
+      parser.walk(('g' if tagName == 'symbol' else tagName, attrs, children))
+    finally:
+      self.using.remove(id)
+    return recorder.result.paths
+
+  # Draws recorded untransformed geometry with the current matrix and opacity
+  def replayPaths(self, paths):
+    handler = self.handler
+    for path in paths:
+      handler.beginPath()
+      self.replayOutline(path)
+      if path.fill:
+        r, g, b, a = path.fill
+        handler.fill(r, g, b, a * self.opacity)
+      if path.stroke:
+        r, g, b, a, width = path.stroke
+        handler.stroke(r, g, b, a * self.opacity, width * self.strokeScale)
+      if self.handlerEndPath:
+        self.handlerEndPath()
+
+  # Draws the commands of an untransformed PackedPath with the current matrix.
+  # When vectorizing, long paths are transformed all at once instead.
+  def replayOutline(self, path):
+    coords = path.coords
+    if self.vectorize and len(coords) >= _VECTORIZE_MIN_COORDS:
+      m = self.matrix
+      _replay_commands(self.handler, path.commands, coords if m.identity else _transform_coords(coords, m), 0)
+      return
+    i = 0
+    for command in path.commands:
+      if command == LINE_TO:
+        self.lineTo(coords[i], coords[i + 1])
+        i += 2
+      elif command == CURVE_TO:
+        self.cubicCurveTo(coords[i], coords[i + 1], coords[i + 2], coords[i + 3], coords[i + 4], coords[i + 5])
+        i += 6
+      elif command == MOVE_TO:
+        self.moveTo(coords[i], coords[i + 1])
+        i += 2
+      else:
         self.handler.closePath()
-        cursor = _Vector(0, 0)
-        delta = None
 
+  # The method that draws each kind of element, by tag name
+  visitors = {
+    'path': visitPath,
+    'rect': visitRect,
+    'line': visitLine,
+    'circle': visitCircle,
+    'ellipse': visitEllipse,
+    'polyline': visitPolyline,
+    'polygon': visitPolygon,
+    'use': visitUse,
+    'svg': visitSVG,
+  }
+
+  def startElement(self, tagName, attrs):
+    self.stack.append((self.matrix, self.opacity, self.hidden))
+    if self.stats is not None:
+      self.stats.elements[tagName] = self.stats.elements.get(tagName, 0) + 1
+    if self.clip is not None and self.startClip(tagName):
+      # A stream can't be read again, so definitions inside culled elements
+      # are still kept for any <use> that comes later
+      if self.captured is None or not (self.hidden or tagName == 'defs' or tagName == 'symbol'):
+        return
+
+    if self.hidden or tagName == 'defs' or tagName == 'symbol':
+      self.hidden = True
+      if self.captured is not None:
+        element = (tagName, attrs, [])
+        if self.captured: self.captured[-1][2].append(element)
+        self.captured.append(element)
+        if attrs.get('id'): self.definitions[attrs.get('id')] = element
+      return
+
+    style = _style(attrs.get('style'))
+    self.opacity *= float(attrs.get('opacity') or style.get('opacity', '1'))
+
+    if attrs.get('transform'):
+      if self.stats is None: self.transform(attrs.get('transform'))
+      else: self.timed('transforms', self.transform, attrs.get('transform'))
+
+    visitor = self.visitors.get(tagName)
+    if visitor is not None:
+      visitor(self, attrs, style)
+
+  def transform(self, text):
+    m = _matrix(text)
+    if not m.identity:
+      self.matrix = self.matrix.multiply(m)
+
+  # Adds the time taken by fn() to a Stats timing, minus the time it spent in
+  # the handler
+  def timed(self, name, fn, *args):
+    timings = self.stats.timings
+    start = _clock()
+    handler = timings['handler']
+    try:
+      fn(*args)
+    finally:
+      timings[name] += _clock() - start - (timings['handler'] - handler)
+
+  def endElement(self, tagName):
+    if self.hidden and self.captured is not None:
+      self.captured.pop()
+    if self.clip is not None:
+      self.endClip()
+    self.matrix, self.opacity, self.hidden = self.stack.pop()
+
+  # Returns True if the element shouldn't be drawn because it's known to be
+  # outside the clip. Nothing is cached for <defs> and <symbol> since they
+  # still need to be read, or for <svg> since it provides the metadata.
+  def startClip(self, tagName):
+    ordinal = self.ordinal
+    self.ordinal += 1
+    cacheable = self.clipCache is not None and not self.hidden and not self.culled and tagName not in ('defs', 'symbol', 'svg')
+    self.clipStack.append((ordinal, self.box, self.culled, cacheable))
+    self.box = None
+    if self.culled:
+      return True
+    if cacheable:
+      cached = self.clipCache.get(ordinal)
+      if cached is not None and (cached[0] is None or not _intersects(cached[0], self.clip)):
+        self.box, self.skipCount = cached
+        self.culled = True
+        return True
+    return False
+
+  def endClip(self):
+    ordinal, parentBox, parentCulled, cacheable = self.clipStack.pop()
+    box = self.box
+    if cacheable and not self.culled:
+      self.clipCache[ordinal] = (box, self.ordinal - ordinal - 1)
+    self.culled = parentCulled
+    self.box = parentBox
+    self.includeBox(box)
+
+  def includeBox(self, box):
+    if box is not None:
+      self.box = box if self.box is None else _union(self.box, box)
+
+  # Walks an element stored as a (tagName, attrs, children) tuple. Like
+  # visit(), this keeps its own stack so nesting depth isn't limited by the
+  # recursion limit.
+  def walk(self, element):
+    stack = []
+    children = iter([element])
+    while True:
+      for tagName, attrs, grandchildren in children:
+        self.startElement(tagName, attrs)
+        stack.append((tagName, children))
+        children = iter(grandchildren)
+        break
+      else:
+        if not stack:
+          return
+        tagName, children = stack.pop()
+        self.endElement(tagName)
+
+  # Walks a DOM node and everything in it. The stack holds the iterator over
+  # the siblings of each open element so the walk can carry on from there
+  # once the element is done. Non-element nodes are skipped without a call.
+  def visit(self, root):
+    ELEMENT_NODE = root.ELEMENT_NODE
+    startElement = self.startElement
+    endElement = self.endElement
+    stack = []
+    nodes = iter([root] if root.nodeType == ELEMENT_NODE else root.childNodes)
+    while True:
+      for node in nodes:
+        if node.nodeType != ELEMENT_NODE:
+          continue
+        tagName = node.tagName
+        startElement(tagName, dict(node.attributes.items()))
+        if self.skipCount is not None:
+          self.ordinal += self.skipCount
+          self.skipCount = None
+        elif node.firstChild is not None:
+          stack.append((tagName, nodes))
+          nodes = iter(node.childNodes)
+          break
+        endElement(tagName)
       else:
+        if not stack:
+          return
+        tagName, nodes = stack.pop()
+        endElement(tagName)
+
+  def _path(self, data):
+    x = y = 0.0
+    dx = dy = None
+    counts = self.stats.commands if self.stats is not None else None
+
+    for command, numbers in _tokenize_path(data):
+      upper = command.upper()
+      arity = _path_arity.get(upper)
+      count = len(numbers)
+      if arity is None:
         raise Exception('Unsupported command syntax: %s' % repr(command))
+      if (count % arity or not count) if arity else count:
+        raise Exception('Wrong number of arguments for command: %s' % repr(command))
+      relative = command != upper
+      if counts is not None:
+        counts[upper] = counts.get(upper, 0) + (count // arity if arity else 1)
+
+      if upper == 'M':
+        for i in range(0, count, 2):
+          ox, oy = (x, y) if relative else (0.0, 0.0)
+          x = numbers[i] + ox
+          y = numbers[i + 1] + oy
+          if i: self.lineTo(x, y)
+          else: self.moveTo(x, y)
+        dx = None
+
+      elif upper == 'L':
+        for i in range(0, count, 2):
+          ox, oy = (x, y) if relative else (0.0, 0.0)
+          x = numbers[i] + ox
+          y = numbers[i + 1] + oy
+          self.lineTo(x, y)
+        dx = None
+
+      elif upper == 'H':
+        for n in numbers:
+          x = n + x if relative else n
+          self.lineTo(x, y)
+        dx = None
+
+      elif upper == 'V':
+        for n in numbers:
+          y = n + y if relative else n
+          self.lineTo(x, y)
+        dx = None
+
+      elif upper == 'Q':
+        for i in range(0, count, 4):
+          ox, oy = (x, y) if relative else (0.0, 0.0)
+          x1 = numbers[i] + ox
+          y1 = numbers[i + 1] + oy
+          x = numbers[i + 2] + ox
+          y = numbers[i + 3] + oy
+          dx = x - x1
+          dy = y - y1
+          self.quadraticCurveTo(x1, y1, x, y)
+
+      elif upper == 'T':
+        for i in range(0, count, 2):
+          ox, oy = (x, y) if relative else (0.0, 0.0)
+          x1, y1 = (x + dx, y + dy) if dx is not None else (x, y)
+          x = numbers[i] + ox
+          y = numbers[i + 1] + oy
+          dx = x - x1
+          dy = y - y1
+          self.quadraticCurveTo(x1, y1, x, y)
+
+      elif upper == 'C':
+        for i in range(0, count, 6):
+          ox, oy = (x, y) if relative else (0.0, 0.0)
+          x1 = numbers[i] + ox
+          y1 = numbers[i + 1] + oy
+          x2 = numbers[i + 2] + ox
+          y2 = numbers[i + 3] + oy
+          x = numbers[i + 4] + ox
+          y = numbers[i + 5] + oy
+          dx = x - x2
+          dy = y - y2
+          self.cubicCurveTo(x1, y1, x2, y2, x, y)
+
+      elif upper == 'S':
+        for i in range(0, count, 4):
+          ox, oy = (x, y) if relative else (0.0, 0.0)
+          x1, y1 = (x + dx, y + dy) if dx is not None else (x, y)
+          x2 = numbers[i] + ox
+          y2 = numbers[i + 1] + oy
+          x = numbers[i + 2] + ox
+          y = numbers[i + 3] + oy
+          dx = x - x2
+          dy = y - y2
+          self.cubicCurveTo(x1, y1, x2, y2, x, y)
+
+      elif upper == 'A':
+        for i in range(0, count, 7):
+          ox, oy = (x, y) if relative else (0.0, 0.0)
+          x0, y0 = x, y
+          x = numbers[i + 5] + ox
+          y = numbers[i + 6] + oy
+          rx = abs(numbers[i])
+          ry = abs(numbers[i + 1])
+          if x == x0 and y == y0:
+            continue
+          if not rx or not ry:
+            self.lineTo(x, y)
+            continue
+          c = _arc_to_cubics(x0, y0, rx, ry, numbers[i + 2], numbers[i + 3], numbers[i + 4], x, y)
+          for j in range(0, len(c), 6):
+            self.cubicCurveTo(c[j], c[j + 1], c[j + 2], c[j + 3], c[j + 4], c[j + 5])
+        dx = None
 
+      else:
+        self.handler.closePath()
+        x = y = 0.0
+        dx = None
+
+# Wraps a function of one argument with a cache of up to "size" results. The
+# cache is emptied when full, which is cheap and works well for documents that
+# repeat a small set of values many times. Results are shared between callers
+# and must not be modified.
+def _memoize(size):
+  def decorator(fn):
+    cache = {}
+    def wrapper(arg):
+      try:
+        return cache[arg]
+      except KeyError:
+        pass
+      if len(cache) >= size:
+        cache.clear()
+      result = cache[arg] = fn(arg)
+      return result
+    wrapper.__wrapped__ = fn
+    wrapper.cache = cache
+    return wrapper
+  return decorator
+
+@_memoize(1024)
 def _color(text):
   text = text.strip()
   text = _color_table.get(text, text)
 
-  if re.match(r'^#[A-Fa-f0-9]{6}$', text):
+  if _COLOR_HEX6.match(text):
     value = int(text[1:], 16)
     return (value >> 16 & 255, value >> 8 & 255, value & 255, 1.0)
 
-  if re.match(r'^#[A-Fa-f0-9]{3}$', text):
+  if _COLOR_HEX3.match(text):
     value = int(text[1:], 16)
     return ((value >> 8 & 15) * 0x11, (value >> 4 & 15) * 0x11, (value & 15) * 0x11, 1.0)
 
-  match = re.match(r'^rgb\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*\)$', text)
+  match = _COLOR_RGB.match(text)
   if match:
     return (int(match.group(1)), int(match.group(2)), int(match.group(3)), 1.0)
 
-  match = re.match(r'^rgba\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+(?:\.\d+)?|\.\d+)\s*\)$', text)
+  match = _COLOR_RGBA.match(text)
   if match:
     return (int(match.group(1)), int(match.group(2)), int(match.group(3)), float(match.group(4)))
 
   raise Exception('Unsupported color syntax: %s' % repr(text))
 
+@_memoize(4096)
 def _units(text):
   return float(text.replace('px', '')) if text else 0.0 # Only handle pixels for now
 
-def _attr(node, name):
-  return node.attributes.get(name).value if node.attributes and node.attributes.get(name) else None
+# Parses a style attribute into a dict of declarations
+@_memoize(1024)
+def _style(text):
+  return dict(tuple(y.strip() for y in x.split(':')) for x in text.split(';') if x) if text else {}
 
-def _tokenize(text):
-  tokens = [x.strip() for x in re.split(r'([+-]?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|[+-]?\.\d+(?:[eE][+-]?\d+)?|\b\s+\b|\w(?=\w))', text)]
-  tokens = [x for x in tokens if x not in ['', ',']]
-  return tokens
+# Splits path data into (command, numbers) groups. Each group is found with a
+# single regex scan and its numbers with another, so there's no per-token work
+# in Python besides the float conversion. Any stray character that isn't part
+# of a number ends up in the number list and fails the conversion.
+def _tokenize_path(text):
+  text = text.strip()
+  groups = _PATH_SEGMENT.findall(text)
+  if text and (not groups or text[0] != groups[0][0]):
+    raise Exception('Unsupported command syntax: %s' % repr(text[0]))
+  return [(command, _arc_numbers(numbers) if command in 'Aa' else list(map(float, _PATH_NUMBER.findall(numbers))))
+    for command, numbers in groups]
+
+# Arc flags are single digits that don't need separators, so "a5 5 0 0110 10"
+# is valid and has to be parsed seven numbers at a time
+def _arc_numbers(text):
+  numbers = []
+  pos = 0
+  while True:
+    match = _ARC_ARGUMENTS.match(text, pos)
+    if not match: break
+    numbers.extend(map(float, match.groups()))
+    pos = match.end()
+  if text[pos:].strip(' \t\r\n,'):
+    raise Exception('Unsupported arc syntax: %s' % repr(text.strip()))
+  return numbers
+
+# Converts the SVG elliptical arc from (x0, y0) to (x, y) into cubic curves of
+# at most 90 degrees each, returned as a flat list of six coordinates per
+# curve. Uses the endpoint to center conversion from the SVG specification
+# (https://www.w3.org/TR/SVG11/implnote.html#ArcImplementationNotes). All the
+# curves are computed in one pass that steps the angle with a rotation instead
+# of calling cos() and sin() for every curve.
+def _arc_to_cubics(x0, y0, rx, ry, angle, largeArc, sweep, x, y):
+  phi = math.radians(angle % 360)
+  cosPhi = math.cos(phi)
+  sinPhi = math.sin(phi)
+
+  # Step 1: move the origin to the midpoint between the endpoints and undo the
+  # rotation of the ellipse
+  hx = (x0 - x) * 0.5
+  hy = (y0 - y) * 0.5
+  x1 = cosPhi * hx + sinPhi * hy
+  y1 = cosPhi * hy - sinPhi * hx
+
+  # Radii that are too small are scaled up until the arc fits
+  scale = (x1 * x1) / (rx * rx) + (y1 * y1) / (ry * ry)
+  if scale > 1:
+    scale = math.sqrt(scale)
+    rx *= scale
+    ry *= scale
+
+  # Step 2: find the center in the unrotated frame
+  rx2 = rx * rx
+  ry2 = ry * ry
+  den = rx2 * y1 * y1 + ry2 * x1 * x1
+  coef = math.sqrt(max(0.0, (rx2 * ry2 - den) / den))
+  if bool(largeArc) == bool(sweep): coef = -coef
+  cx1 = coef * rx * y1 / ry
+  cy1 = -coef * ry * x1 / rx
+
+  # Step 3: the center in user space and the start and sweep angles
+  cx = cosPhi * cx1 - sinPhi * cy1 + (x0 + x) * 0.5
+  cy = sinPhi * cx1 + cosPhi * cy1 + (y0 + y) * 0.5
+  theta = math.atan2((y1 - cy1) / ry, (x1 - cx1) / rx)
+  delta = math.atan2((-y1 - cy1) / ry, (-x1 - cx1) / rx) - theta
+  if sweep and delta < 0: delta += 2 * math.pi
+  elif not sweep and delta > 0: delta -= 2 * math.pi
+
+  # Each piece is a unit circle arc with the standard tangent length, mapped
+  # onto the ellipse with this matrix
+  count = max(1, int(math.ceil(abs(delta) / (math.pi / 2) - 1e-9)))
+  step = delta / count
+  k = 4.0 / 3.0 * math.tan(step / 4)
+  a = rx * cosPhi
+  b = -ry * sinPhi
+  c = rx * sinPhi
+  d = ry * cosPhi
+  cosStep = math.cos(step)
+  sinStep = math.sin(step)
+  u = math.cos(theta)
+  v = math.sin(theta)
+
+  result = []
+  for i in range(count):
+    u2 = u * cosStep - v * sinStep
+    v2 = v * cosStep + u * sinStep
+    p1u = u - k * v
+    p1v = v + k * u
+    p2u = u2 + k * v2
+    p2v = v2 - k * u2
+    result.extend((
+      cx + a * p1u + b * p1v, cy + c * p1u + d * p1v,
+      cx + a * p2u + b * p2v, cy + c * p2u + d * p2v,
+      cx + a * u2 + b * v2, cy + c * u2 + d * v2))
+    u = u2
+    v = v2
+
+  # Land exactly on the endpoint instead of wherever rounding put it
+  result[-2] = x
+  result[-1] = y
+  return result
+
+# Returns a function that finds elements in a DOM by id and returns them as
+# (tagName, attrs, children) tuples. The id map is built on first use.
+def _dom_lookup(doc):
+  ids = []
+  def lookup(id):
+    if not ids:
+      ids.append(_dom_ids(doc))
+    node = ids[0].get(id)
+    return _dom_element(node) if node is not None else None
+  return lookup
+
+# Maps each id in a DOM document to the first element with it. This walks the
+# tree with a stack since getElementsByTagName() is recursive.
+def _dom_ids(doc):
+  ids = {}
+  stack = [doc]
+  while stack:
+    node = stack.pop()
+    if node.nodeType == node.ELEMENT_NODE:
+      id = node.getAttribute('id')
+      if id and id not in ids:
+        ids[id] = node
+    stack.extend(reversed(node.childNodes))
+  return ids
+
+# Converts a DOM node and everything in it to (tagName, attrs, children)
+# tuples. Children are filled in from a stack so deep nesting can't hit the
+# recursion limit.
+def _dom_element(root):
+  ELEMENT_NODE = root.ELEMENT_NODE
+  element = (root.tagName, dict(root.attributes.items()), [])
+  stack = [(root, element[2])]
+  while stack:
+    node, children = stack.pop()
+    for child in node.childNodes:
+      if child.nodeType == ELEMENT_NODE:
+        children.append((child.tagName, dict(child.attributes.items()), []))
+        stack.append((child, children[-1][2]))
+  return element
+
+def _replay_matrix(matrix):
+  a, b, c, d, e, f = matrix
+  return _Matrix(a, c, e, b, d, f)
+
+# Returns "coords" transformed by the _Matrix "m" as a list. Long runs of
+# coordinates are transformed with NumPy when it's installed.
+def _transform_coords(coords, m):
+  numpy = _numpy() if len(coords) >= _VECTORIZE_MIN_COORDS else None
+  if numpy is not None:
+    points = numpy.asarray(coords, dtype=numpy.float64).reshape(-1, 2)
+    matrix = numpy.array([[m.m00, m.m10], [m.m01, m.m11]])
+    result = numpy.dot(points, matrix)
+    result += (m.m02, m.m12)
+    return result.ravel().tolist()
+  xs = coords[0::2]
+  ys = coords[1::2]
+  result = [0.0] * len(coords)
+  result[0::2] = [m.m00 * x + m.m01 * y + m.m02 for x, y in zip(xs, ys)]
+  result[1::2] = [m.m10 * x + m.m11 * y + m.m12 for x, y in zip(xs, ys)]
+  return result
+
+def _stroke_scale(m):
+  return math.sqrt(abs(m.m00 * m.m11 - m.m01 * m.m10))
+
+# Sends one path's commands to a handler, reading points from "coords"
+# starting at index "i". Returns the index after the last point used.
+def _replay_path(handler, commands, coords, i, fill, stroke, strokeScale):
+  handler.beginPath()
+  i = _replay_commands(handler, commands, coords, i)
+  if fill:
+    handler.fill(*fill)
+  if stroke:
+    r, g, b, a, width = stroke
+    handler.stroke(r, g, b, a, width * strokeScale)
+  if hasattr(handler, 'endPath'):
+    handler.endPath()
+  return i
+
+# Sends just the commands of a path to a handler, like _replay_path()
+def _replay_commands(handler, commands, coords, i):
+  for command in commands:
+    if command == LINE_TO:
+      handler.lineTo(coords[i], coords[i + 1])
+      i += 2
+    elif command == CURVE_TO:
+      handler.curveTo(coords[i], coords[i + 1], coords[i + 2], coords[i + 3], coords[i + 4], coords[i + 5])
+      i += 6
+    elif command == MOVE_TO:
+      handler.moveTo(coords[i], coords[i + 1])
+      i += 2
+    else:
+      handler.closePath()
+  return i
+
+# Returns the numpy module, or None if it isn't installed. It's only imported
+# the first time it's needed since it takes a while.
+def _numpy():
+  if not _numpy_module:
+    try:
+      import numpy
+    except ImportError:
+      numpy = None
+    _numpy_module.append(numpy)
+  return _numpy_module[0]
+
+_numpy_module = []
+
+# Fills in a TriangleMesh for a list of contours, each a flat list of x, y
+# values. Contours are assumed not to cross each other, so a contour is inside
+# another if any of its points is. The region just inside each contour is
+# filled or not depending on the contours around it and the fill rule, and
+# each filled region is that contour minus the ones directly inside it.
+def _triangulate(contours, evenOdd, mesh):
+  rings = []
+  for contour in contours:
+    points = []
+    for x, y in zip(contour[0::2], contour[1::2]):
+      if not points or points[-1] != (x, y):
+        points.append((x, y))
+    while len(points) > 1 and points[0] == points[-1]:
+      points.pop()
+    if len(points) >= 3:
+      area = _ring_area(points)
+      if area:
+        rings.append((points, area))
+
+  # For each ring, the rings around it
+  outside = [[j for j, (other, area) in enumerate(rings) if j != i and _ring_inside(points, other)]
+    for i, (points, area) in enumerate(rings)]
+
+  vertices = mesh.vertices
+  for i, (points, area) in enumerate(rings):
+    if evenOdd:
+      filled = len(outside[i]) % 2 == 0
+    else:
+      filled = (1 if area > 0 else -1) + sum(1 if rings[j][1] > 0 else -1 for j in outside[i]) != 0
+    if not filled:
+      continue
+
+    # Indices into the mesh for the ring, counterclockwise, and its holes,
+    # clockwise, which are the rings with one more ring around them
+    def indices(points, clockwise):
+      start = len(vertices) // 2
+      for x, y in points: vertices.extend((x, y))
+      ring = list(range(start, start + len(points)))
+      return ring[::-1] if (_ring_area(points) < 0) != clockwise else ring
+    ring = indices(points, False)
+    holes = [indices(rings[j][0], True) for j in range(len(rings)) if i in outside[j] and len(outside[j]) == len(outside[i]) + 1]
+    for hole in sorted(holes, key=lambda hole: -max(vertices[2 * k] for k in hole)):
+      ring = _bridge_hole(ring, hole, vertices)
+    _ear_clip(ring, vertices, mesh.indices)
+
+# Twice the signed area of a ring of (x, y) points
+def _ring_area(points):
+  area = 0
+  x0, y0 = points[-1]
+  for x1, y1 in points:
+    area += x0 * y1 - x1 * y0
+    x0, y0 = x1, y1
+  return area
+
+# Returns True if the ring "inner" is inside the ring "outer", assuming they
+# don't cross. Rings can touch, so this tests the first point of "inner" that
+# isn't on the edge of "outer", trying the middles of its edges if all of its
+# corners are.
+def _ring_inside(inner, outer):
+  for point in inner:
+    if not _point_on_ring(point, outer):
+      return _point_in_ring(point, outer)
+  x0, y0 = inner[-1]
+  for x1, y1 in inner:
+    point = ((x0 + x1) * 0.5, (y0 + y1) * 0.5)
+    if not _point_on_ring(point, outer):
+      return _point_in_ring(point, outer)
+    x0, y0 = x1, y1
+  return False
+
+def _point_on_ring(point, points):
+  x, y = point
+  x0, y0 = points[-1]
+  for x1, y1 in points:
+    if (x1 - x0) * (y - y0) == (y1 - y0) * (x - x0) and min(x0, x1) <= x <= max(x0, x1) and min(y0, y1) <= y <= max(y0, y1):
+      return True
+    x0, y0 = x1, y1
+  return False
+
+def _point_in_ring(point, points):
+  x, y = point
+  inside = False
+  x0, y0 = points[-1]
+  for x1, y1 in points:
+    if (y0 > y) != (y1 > y) and x < x0 + (y - y0) * (x1 - x0) / float(y1 - y0):
+      inside = not inside
+    x0, y0 = x1, y1
+  return inside
+
+# Joins a clockwise hole to a counterclockwise ring with a pair of edges, so
+# the result can be triangulated as one polygon. The hole's rightmost point is
+# connected to a ring point it can see, found by looking to its right (David
+# Eberly, "Triangulation by Ear Clipping").
+def _bridge_hole(ring, hole, vertices):
+  m = max(range(len(hole)), key=lambda k: vertices[2 * hole[k]])
+  mx, my = vertices[2 * hole[m]], vertices[2 * hole[m] + 1]
+
+  # The closest edge crossed by a ray going right from the hole's point
+  best = None
+  nearest = float('inf')
+  for k in range(len(ring)):
+    ax, ay = vertices[2 * ring[k - 1]], vertices[2 * ring[k - 1] + 1]
+    bx, by = vertices[2 * ring[k]], vertices[2 * ring[k] + 1]
+    if (ay <= my <= by or by <= my <= ay) and ay != by:
+      x = ax + (my - ay) * (bx - ax) / float(by - ay)
+      if mx <= x < nearest:
+        nearest = x
+        best = k if bx > ax else k - 1
+  if best is None:
+    return ring
+
+  # Another point of the ring may be in the way, in which case the one closest
+  # in angle to the ray is used instead
+  px, py = vertices[2 * ring[best]], vertices[2 * ring[best] + 1]
+  if px != nearest or py != my:
+    ix = nearest
+    lowest = None
+    # (the bridge goes from (mx, my) to (ix, my) along the ray, then to P)
+    for k in range(len(ring)):
+      qx, qy = vertices[2 * ring[k]], vertices[2 * ring[k] + 1]
+      if qx >= mx and k != best and _in_triangle(mx, my, ix, my, px, py, qx, qy):
+        angle = abs(qy - my) / float(qx - mx) if qx > mx else float('inf')
+        if lowest is None or angle < lowest:
+          lowest = angle
+          best = k
+  best %= len(ring)
+
+  # Points joined by earlier bridges are in the ring twice, and only one of
+  # them faces the hole
+  px, py = vertices[2 * ring[best]], vertices[2 * ring[best] + 1]
+  for k in range(len(ring)):
+    if vertices[2 * ring[k]] == px and vertices[2 * ring[k] + 1] == py and \
+        _in_sector(vertices, ring[k - 1], ring[k], ring[(k + 1) % len(ring)], mx, my):
+      best = k
+      break
+  if px == mx and py == my:
+    return ring[:best + 1] + hole[m + 1:] + hole[:m] + ring[best:] # The hole touches the ring there
+  return ring[:best + 1] + hole[m:] + hole[:m + 1] + ring[best:]
+
+# Whether (px, py) is in the inside angle of a counterclockwise polygon at
+# vertex "b", between the edges from "a" and to "c"
+def _in_sector(vertices, a, b, c, px, py):
+  ax, ay, bx, by, cx, cy = vertices[2 * a], vertices[2 * a + 1], vertices[2 * b], vertices[2 * b + 1], vertices[2 * c], vertices[2 * c + 1]
+  left = (bx - ax) * (py - ay) - (by - ay) * (px - ax) >= 0
+  right = (cx - bx) * (py - by) - (cy - by) * (px - bx) >= 0
+  if (bx - ax) * (cy - by) - (by - ay) * (cx - bx) >= 0:
+    return left and right
+  return left or right
+
+# Whether (px, py) is inside or on the edge of a triangle in either direction
+def _in_triangle(ax, ay, bx, by, cx, cy, px, py):
+  d1 = (bx - ax) * (py - ay) - (by - ay) * (px - ax)
+  d2 = (cx - bx) * (py - by) - (cy - by) * (px - bx)
+  d3 = (ax - cx) * (py - cy) - (ay - cy) * (px - cx)
+  return (d1 >= 0 and d2 >= 0 and d3 >= 0) or (d1 <= 0 and d2 <= 0 and d3 <= 0)
+
+# Splits a counterclockwise polygon, given as indices into "vertices", into
+# triangles by repeatedly cutting off a corner with no other points inside.
+# Self-intersecting polygons can run out of such corners, and then any convex
+# corner is cut off from then on (or any corner at all if there are none) so
+# the loop always finishes quickly.
+def _ear_clip(ring, vertices, indices):
+  ring = list(ring)
+  xs = vertices[0::2]
+  ys = vertices[1::2]
+  i = 0
+  stalled = 0
+  careful = True
+  # Points that are in the ring more than once, where holes touch the outline
+  # or bridges join them
+  seen = set()
+  pinches = set()
+  for k in ring:
+    point = (xs[k], ys[k])
+    if point in seen: pinches.add(point)
+    seen.add(point)
+  while len(ring) > 3:
+    n = len(ring)
+    i %= n
+    a, b, c = ring[i - 1], ring[i], ring[(i + 1) % n]
+    ax, ay, bx, by, cx, cy = xs[a], ys[a], xs[b], ys[b], xs[c], ys[c]
+    cross = (bx - ax) * (cy - by) - (by - ay) * (cx - bx)
+    if cross == 0:
+      del ring[i]
+      continue
+    ear = cross > 0 or stalled >= n
+    if ear and careful:
+      minX, maxX = min(ax, bx, cx), max(ax, bx, cx)
+      minY, maxY = min(ay, by, cy), max(ay, by, cy)
+      for k in ring:
+        px, py = xs[k], ys[k]
+        if minX <= px <= maxX and minY <= py <= maxY and (px, py) not in ((ax, ay), (bx, by), (cx, cy)) and \
+            _in_triangle(ax, ay, bx, by, cx, cy, px, py):
+          ear = False
+          break
+      # Other edges meeting at the same point as "b" mustn't go into the ear
+      if ear and (bx, by) in pinches:
+        for k in range(n):
+          if ring[k] != b and xs[ring[k]] == bx and ys[ring[k]] == by:
+            for e in (ring[k - 1], ring[(k + 1) % n]):
+              ex, ey = xs[e], ys[e]
+              if (bx - ax) * (ey - by) - (by - ay) * (ex - bx) > 0 and (cx - bx) * (ey - by) - (cy - by) * (ex - bx) > 0:
+                ear = False
+    if ear:
+      indices.extend((a, b, c))
+      del ring[i]
+      i -= 1 # The corner before may have become a spike or a new ear
+      stalled = 0
+    else:
+      i += 1
+      stalled += 1
+      if stalled >= n and careful:
+        careful = False
+        stalled = 0
+  if len(ring) == 3:
+    indices.extend(ring)
+
+# Calls lineTo() for points along the cubic curve from (x0, y0) so that the
+# lines are never more than "tolerance" away from the curve. The number of
+# lines is picked per curve using Wang's formula, which bounds the distance in
+# terms of the second differences of the control points, so small or nearly
+# straight curves get very few lines and large tight ones get more. Measured
+# on icon sets this uses fewer lines than recursively splitting the curve in
+# half until each piece is flat enough, and is a lot faster. The points are
+# stepped along using forward differences.
+def _flatten_cubic(x0, y0, x1, y1, x2, y2, x3, y3, tolerance, lineTo):
+  ax = x0 - 2 * x1 + x2
+  ay = y0 - 2 * y1 + y2
+  bx = x1 - 2 * x2 + x3
+  by = y1 - 2 * y2 + y3
+  n = int(math.ceil(math.sqrt(0.75 * math.sqrt(max(ax * ax + ay * ay, bx * bx + by * by)) / tolerance)))
+  n = max(1, min(n, _FLATTEN_MAX_LINES))
+
+  h = 1.0 / n
+  h2 = h * h
+  h3 = h2 * h
+  cx = 3 * (x1 - x0)
+  cy = 3 * (y1 - y0)
+  bx = 3 * ax
+  by = 3 * ay
+  ax = x3 - x0 + 3 * (x1 - x2)
+  ay = y3 - y0 + 3 * (y1 - y2)
+  dx1 = ax * h3 + bx * h2 + cx * h
+  dy1 = ay * h3 + by * h2 + cy * h
+  dx2 = 6 * ax * h3 + 2 * bx * h2
+  dy2 = 6 * ay * h3 + 2 * by * h2
+  dx3 = 6 * ax * h3
+  dy3 = 6 * ay * h3
+
+  x = x0
+  y = y0
+  for i in range(n - 1):
+    x += dx1
+    y += dy1
+    dx1 += dx2
+    dy1 += dy2
+    dx2 += dx3
+    dy2 += dy3
+    lineTo(x, y)
+  lineTo(x3, y3)
+
+# Returns the indices of the points to keep from "points", a flat list of x
+# and y values, so that no point is more than "tolerance" away from the lines
+# between the kept ones. Uses an explicit stack instead of recursion so long
+# runs can't hit the recursion limit.
+def _simplify_polyline(points, tolerance):
+  xs = points[0::2]
+  ys = points[1::2]
+  keep = [0]
+  stack = [(0, len(xs) - 1)]
+  limit = tolerance * tolerance
+  while stack:
+    first, last = stack.pop()
+    ax, ay = xs[first], ys[first]
+    dx, dy = xs[last] - ax, ys[last] - ay
+    length = float(dx * dx + dy * dy) or 1
+    farthest = limit
+    index = None
+    i = first
+    for x, y in zip(xs[first + 1:last], ys[first + 1:last]):
+      i += 1
+      x -= ax
+      y -= ay
+      t = (x * dx + y * dy) / length
+      if t > 1: t = 1
+      elif t < 0: t = 0
+      x -= t * dx
+      y -= t * dy
+      if x * x + y * y > farthest:
+        farthest = x * x + y * y
+        index = i
+    if index is None:
+      keep.append(last)
+    else:
+      stack.append((index, last))
+      stack.append((first, index))
+  return keep
+
+# Returns the range covered by a cubic curve along one axis, checking where
+# the derivative is zero when the control points stick out past the ends
+def _cubic_extent(p0, p1, p2, p3):
+  low = min(p0, p3)
+  high = max(p0, p3)
+  if low <= p1 <= high and low <= p2 <= high:
+    return low, high
+
+  a = 3 * (p3 - p0) + 9 * (p1 - p2)
+  b = 6 * (p0 - 2 * p1 + p2)
+  c = 3 * (p1 - p0)
+  if abs(a) < 1e-12:
+    roots = [-c / b] if b else []
+  else:
+    d = b * b - 4 * a * c
+    if d < 0:
+      roots = []
+    else:
+      d = math.sqrt(d)
+      roots = [(-b + d) / (2 * a), (-b - d) / (2 * a)]
+
+  for t in roots:
+    if 0 < t < 1:
+      s = 1 - t
+      p = s * s * s * p0 + 3 * s * s * t * p1 + 3 * s * t * t * p2 + t * t * t * p3
+      low = min(low, p)
+      high = max(high, p)
+  return low, high
+
+def _union(a, b):
+  return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+def _intersects(a, b):
+  return a[0] <= b[2] and a[2] >= b[0] and a[1] <= b[3] and a[3] >= b[1]
+
+# Appends the unsigned number "n" to the bytearray "data" as a varint
+def _write_varint(data, n):
+  while n > 0x7f:
+    data.append(n & 0x7f | 0x80)
+    n >>= 7
+  data.append(n)
+
+# Returns the unsigned varint at index "i" in "data" and the index after it
+def _read_varint(data, i):
+  n = shift = 0
+  while True:
+    byte = data[i]
+    i += 1
+    n |= (byte & 0x7f) << shift
+    if byte < 0x80: return n, i
+    shift += 7
+
+def _array_bytes(a):
+  return a.tobytes() if hasattr(a, 'tobytes') else a.tostring()
+
+# Returns "count" items of type "typecode" stored little-endian at "offset" in
+# "buffer", without copying when possible
+def _buffer_view(buffer, offset, typecode, count):
+  size = array.array(typecode).itemsize * count
+  if sys.byteorder == 'little' and hasattr(memoryview, 'cast'):
+    return memoryview(buffer)[offset:offset + size].cast(typecode)
+  items = array.array(typecode, bytes(buffer[offset:offset + size]))
+  if sys.byteorder != 'little':
+    items.byteswap()
+  return items
 
 def _points(text):
-  tokens = _tokenize(text)
-  return [_Vector(float(p[0]), float(p[1])) for p in zip(tokens[::2], tokens[1::2])]
+  numbers = list(map(float, _PATH_NUMBER.findall(text)))
+  return list(zip(numbers[::2], numbers[1::2]))
 
+# Parses a transform list like "translate(10 20) rotate(45)" into one matrix.
+# Elements often repeat the same transform, so results are cached.
+@_memoize(1024)
 def _matrix(text):
-  match = re.match(r'matrix\s*\(\s*([^,\s]*)[,\s]+([^,\s]*)[,\s]+([^,\s]*)[,\s]+([^,\s]*)[,\s]+([^,\s]*)[,\s]+([^,\s]*)\s*\)', text)
-  if match:
-    numbers = map(float, list(match.groups()))
-    return _Matrix(numbers[0], numbers[2], numbers[4], numbers[1], numbers[3], numbers[5])
-
-  match = re.match(r'translate\s*\(\s*([^,\s]*)[,\s]+([^,\s]*)\s*\)', text)
-  if match:
-    numbers = map(float, list(match.groups()))
-    return _Matrix(1, 0, numbers[0], 0, 1, numbers[1])
-
-  raise Exception('Unsupported transform syntax: %s' % repr(text))
+  result = _Matrix()
+  text = text.strip()
+  pos = 0
+
+  while pos < len(text):
+    match = _TRANSFORM.match(text, pos)
+    if not match:
+      raise Exception('Unsupported transform syntax: %s' % repr(text))
+    name, args = match.groups()
+    try:
+      numbers = [float(x) for x in _PATH_NUMBER.findall(args)]
+    except ValueError:
+      raise Exception('Unsupported transform syntax: %s' % repr(text))
+    m = _transform_matrix(name, numbers)
+    if m is None:
+      raise Exception('Unsupported transform syntax: %s' % repr(text))
+    result = result.multiply(m)
+    pos = match.end()
+
+  return result
+
+# Returns the matrix for one item in a transform list, or None if it has the
+# wrong number of arguments
+def _transform_matrix(name, n):
+  count = len(n)
+
+  if name == 'matrix' and count == 6:
+    return _Matrix(n[0], n[2], n[4], n[1], n[3], n[5])
+
+  if name == 'translate' and count in (1, 2):
+    return _Matrix(1, 0, n[0], 0, 1, n[1] if count == 2 else 0)
+
+  if name == 'scale' and count in (1, 2):
+    return _Matrix(n[0], 0, 0, 0, n[-1], 0)
+
+  if name == 'rotate' and count in (1, 3):
+    c = math.cos(math.radians(n[0]))
+    s = math.sin(math.radians(n[0]))
+    x, y = (n[1], n[2]) if count == 3 else (0, 0)
+    return _Matrix(c, -s, x - c * x + s * y, s, c, y - s * x - c * y)
+
+  if name == 'skewX' and count == 1:
+    return _Matrix(1, math.tan(math.radians(n[0])), 0, 0, 1, 0)
+
+  if name == 'skewY' and count == 1:
+    return _Matrix(1, 0, 0, math.tan(math.radians(n[0])), 1, 0)
+
+  return None
+
+def _parse_batch_item(source):
+  result = BatchResult()
+  try:
+    if not isinstance(source, bytes):
+      with open(source, 'rb') as f:
+        source = f.read()
+    parse(source, RecordingHandler(result))
+  except Exception as e:
+    result = BatchResult()
+    result.error = '%s: %s' % (type(e).__name__, e)
+  return result
+
+# Command-line entry point: parses the given files with parse_batch() and
+# prints a summary line for each one
+def main(args=None):
+  import argparse
+  parser = argparse.ArgumentParser(description='Extract the geometry from SVG files in parallel.')
+  parser.add_argument('files', nargs='+', help='SVG files to parse')
+  parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: one per CPU)')
+  options = parser.parse_args(args)
+  failed = False
+  for path, result in zip(options.files, parse_batch(options.files, options.workers)):
+    if result.error:
+      print('%s: error: %s' % (path, result.error))
+      failed = True
+    else:
+      segments = sum(len(p.commands) for p in result.paths)
+      print('%s: %d paths, %d segments' % (path, len(result.paths), segments))
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
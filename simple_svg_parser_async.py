@@ -0,0 +1,47 @@
+# Asyncio entry points for simple_svg_parser. These live in their own module
+# because "async def" is a syntax error on Python 2, where the rest of the
+# library still works. Requires Python 3.6 or later.
+import asyncio
+import collections
+import simple_svg_parser
+
+# Like parse_stream() but reads from "stream", which is either something with
+# an async read(size) method like asyncio.StreamReader or an async iterable of
+# bytes. Control goes back to the event loop after every "sliceSize" bytes are
+# parsed so a big document doesn't stall other tasks. Takes the same options
+# as parse().
+async def parse_async(stream, handler, chunkSize=65536, sliceSize=4096, **options):
+  async for _ in _parse_chunks(stream, handler, chunkSize, sliceSize, options):
+    pass
+
+# Like iter_shapes() but as an async iterator over a stream, as for
+# parse_async()
+async def iter_shapes_async(stream, chunkSize=65536, sliceSize=4096, **options):
+  shapes = collections.deque()
+  handler = simple_svg_parser.PackedHandler(shapes.append)
+  async for _ in _parse_chunks(stream, handler, chunkSize, sliceSize, options):
+    while shapes:
+      yield shapes.popleft()
+  while shapes:
+    yield shapes.popleft()
+
+# Yields after each slice of the stream is parsed, having given other tasks a
+# chance to run
+async def _parse_chunks(stream, handler, chunkSize, sliceSize, options):
+  parser = simple_svg_parser._StreamParser(handler, options)
+  async for data in _read_chunks(stream, chunkSize):
+    for i in range(0, len(data), sliceSize):
+      parser.feed(data[i:i + sliceSize])
+      yield
+      await asyncio.sleep(0)
+  parser.close()
+
+async def _read_chunks(stream, chunkSize):
+  if hasattr(stream, 'read'):
+    while True:
+      data = await stream.read(chunkSize)
+      if not data: break
+      yield data
+  else:
+    async for data in stream:
+      yield data
@@ -1,3 +1,10 @@
+import io
+import os
+import math
+import re
+import sys
+import shutil
+import tempfile
 import simple_svg_parser
 
 class Handler:
@@ -84,6 +91,46 @@ svg = ['''
   <rect x="60" y="110" width="130" height="180" fill=" rgb( 255 , 0 , 0 ) "/>
   <path d="M.0.0-200+200+200+200zM100 250 100 150" fill="rgba(0, 255, 0, 0.5)" stroke="black" stroke-width="4"/>
 </svg>
+''', '''
+<svg xmlns="http://www.w3.org/2000/svg" width="500px" height="500px">
+  <g transform="translate(250, 250) scale(2)">
+    <rect transform="rotate(45)" x="-20" y="-20" width="40" height="40" fill="red"/>
+    <rect transform="rotate(45 50 50)" x="30" y="30" width="40" height="40" fill="green"/>
+    <rect transform="translate(-100) skewX(30)" x="0" y="-20" width="40" height="40" fill="blue"/>
+    <rect transform="translate(-100,50),skewY(30)" x="0" y="0" width="40" height="40" fill="orange"/>
+    <circle transform="scale(2 0.5) translate(-40 100)" r="20" fill="purple"/>
+  </g>
+</svg>
+''', '''
+<svg xmlns="http://www.w3.org/2000/svg" width="500px" height="500px">
+  <path d="M 250 250 L 400 250 A 150 150 0 0 1 143.93 356.07 Z" fill="#4A90D9"/>
+  <path d="M 250 250 L 143.93 356.07 A 150 150 0 0 1 250 100 Z" fill="#E94E3C"/>
+  <path d="M 250 250 L 250 100 A 150 150 0 0 1 400 250 Z" fill="#F5A623"/>
+  <path d="M 20 80 a 25 50 -30 1 0 50 -25 a25,50 -30 0,1 50,-25" fill="none" stroke="black" stroke-width="3"/>
+  <path d="M 20 480 h 30 a5 5 0 0110 0 h30 a 0 5 0 0 1 10 0 a 5 5 0 0 1 0 0" fill="none" stroke="green" stroke-width="2"/>
+</svg>
+''', '''
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="500px" height="500px">
+  <defs>
+    <path id="arrow" d="M 0 -10 L 20 0 L 0 10 Z" fill="teal" stroke="black"/>
+    <g id="pair" opacity="0.5">
+      <circle r="10" fill="red"/>
+      <use xlink:href="#arrow" x="15"/>
+    </g>
+  </defs>
+  <symbol id="badge">
+    <rect x="-15" y="-15" width="30" height="30" rx="5" fill="gold"/>
+    <use href="#arrow" transform="scale(0.5)"/>
+  </symbol>
+  <use xlink:href="#arrow" x="50" y="50"/>
+  <use xlink:href="#arrow" x="100" y="50" transform="rotate(30)" opacity="0.5"/>
+  <use xlink:href="#pair" x="50" y="150"/>
+  <g transform="translate(0 100)">
+    <use xlink:href="#badge" x="150" y="150"/>
+    <use xlink:href="#badge" x="200" y="150"/>
+  </g>
+  <use xlink:href="#missing"/>
+</svg>
 ''']
 
 html = '''
@@ -98,5 +145,361 @@ output = ''
 for xml in svg:
   handler = Handler()
   simple_svg_parser.parse(xml, handler)
+
+  # Streaming must produce exactly the same calls as parsing the whole DOM
+  streamed = Handler()
+  simple_svg_parser.parse_stream(io.BytesIO(xml.encode('utf8')), streamed, chunkSize=64)
+  assert streamed.lines == handler.lines
+
+  # Packed paths must replay to the same calls
+  replayed = Handler()
+  packer = simple_svg_parser.PackedHandler(lambda path: path.replay(replayed))
+  packer.metadata = replayed.metadata
+  simple_svg_parser.parse(xml, packer)
+  assert replayed.lines == handler.lines
+
+  # Recorded geometry must replay to the same calls, with or without an extra
+  # transform
+  recorded = simple_svg_parser.record(xml)
+  replayed = Handler()
+  recorded.replay(replayed)
+  assert replayed.lines == handler.lines
+  replayed = Handler()
+  recorded.replay(replayed, matrix=(2, 0, 0, 2, 0, 0))
+  assert len(replayed.lines) == len(handler.lines) and replayed.lines != handler.lines
+
+  # The binary format must round trip exactly at double precision, both from
+  # bytes and from a memory-mapped file
+  writer = simple_svg_parser.BinaryWriter(doublePrecision=True)
+  simple_svg_parser.parse(xml, writer)
+  replayed = Handler()
+  simple_svg_parser.BinaryGeometry(writer.getvalue()).replay(replayed)
+  assert replayed.lines == handler.lines
+  fd, binary = tempfile.mkstemp()
+  with os.fdopen(fd, 'wb') as f:
+    writer.write(f)
+  replayed = Handler()
+  geometry = simple_svg_parser.load_binary(binary)
+  geometry.replay(replayed)
+  assert replayed.lines == handler.lines and len(geometry) == len(recorded.paths)
+  del geometry
+  os.remove(binary)
+
+  # Quantized geometry must come back with the same calls and every point
+  # within half a grid step
+  writer = simple_svg_parser.QuantizedWriter(grid=0.01)
+  simple_svg_parser.parse(xml, writer)
+  decoded = simple_svg_parser.RecordingHandler()
+  simple_svg_parser.QuantizedGeometry(writer.getvalue()).replay(decoded)
+  assert decoded.result.metadata == recorded.metadata
+  assert len(decoded.result.paths) == len(recorded.paths)
+  for a, b in zip(decoded.result.paths, recorded.paths):
+    assert (a.commands, a.fill, a.stroke) == (b.commands, b.fill, b.stroke)
+    assert all(abs(x - y) <= 0.005 + 1e-9 for x, y in zip(a.coords, b.coords))
+
   output += html % (xml, '\n'.join(handler.lines))
 open('test.html', 'w').write(output)
+
+# Batches keep their order and report errors per source
+if sys.version_info[0] >= 3:
+  blobs = [xml.encode('utf8') for xml in svg]
+  results = simple_svg_parser.parse_batch(blobs[:1] + [b'<svg><path d="M 0 0 X"/></svg>'] + blobs[1:], workers=2)
+  assert [bool(result.error) for result in results] == [False, True] + [False] * (len(blobs) - 1)
+  assert results[2].metadata == {'width': 500.0, 'height': 500.0}
+  assert len(results[0].paths) == 22
+
+# Cached results are reused from memory and from disk
+directory = tempfile.mkdtemp()
+try:
+  cache = simple_svg_parser.ParseCache(maxSize=1, directory=directory)
+  first = cache.record(svg[0])
+  assert cache.record(svg[0]) is first
+  cache.record(svg[1])
+  assert (cache.hits, cache.misses, len(cache.entries)) == (1, 2, 1)
+  cache = simple_svg_parser.ParseCache(directory=directory)
+  cached = Handler()
+  cache.parse(svg[0], cached)
+  assert (cache.hits, cache.misses) == (1, 0)
+  direct = Handler()
+  simple_svg_parser.parse(svg[0], direct)
+  assert cached.lines == direct.lines
+
+  # Equal options share an entry, and options that the parse would fill in
+  # are rejected since a replay can't fill them
+  cache = simple_svg_parser.ParseCache()
+  first = cache.record(svg[0], tolerance=1, clip=[0, 0, 250, 250])
+  assert cache.record(svg[0], tolerance=1.0, clip=(0, 0, 250, 250), vectorize=True) is first
+  assert cache.record(svg[0], clip=None) is cache.record(svg[0])
+
+  # Results that can't be saved are still returned
+  cache = simple_svg_parser.ParseCache(directory=os.path.join(directory, 'missing'))
+  assert len(cache.record(svg[0]).paths) == len(simple_svg_parser.record(svg[0]).paths)
+  try:
+    cache.record(svg[0], bounds=simple_svg_parser.Bounds())
+    assert False
+  except Exception as e:
+    assert 'bounds' in str(e)
+finally:
+  shutil.rmtree(directory)
+
+# Quantized colors are clamped to what fits in a byte
+writer = simple_svg_parser.QuantizedWriter()
+simple_svg_parser.parse('<svg><rect width="1" height="1" fill="rgb(300, 0, 0)"/></svg>', writer)
+decoded = simple_svg_parser.RecordingHandler()
+simple_svg_parser.QuantizedGeometry(writer.getvalue()).replay(decoded)
+assert decoded.result.paths[0].fill == (255, 0, 0, 1.0)
+
+# Flattening replaces curves with lines that stay within the tolerance, using
+# fewer lines for smaller curves
+def flattened_circle(radius, scale, tolerance):
+  points = []
+  class Collector(simple_svg_parser.HandlerInterface):
+    def moveTo(self, x, y): points.append((x, y))
+    def lineTo(self, x, y): points.append((x, y))
+    def curveTo(self, x1, y1, x2, y2, x3, y3): assert False
+  simple_svg_parser.parse('<svg><g transform="matrix(%s 0 0 %s 0 0)"><circle r="%s"/></g></svg>' %
+    (scale, scale, radius), Collector(), tolerance=tolerance)
+  for (x1, y1), (x2, y2) in zip(points, points[1:]):
+    distance = abs(radius * scale - ((x1 + x2) ** 2 + (y1 + y2) ** 2) ** 0.5 / 2)
+    assert distance <= tolerance, distance
+  return len(points)
+assert flattened_circle(100, 1, 0.1) > flattened_circle(10, 1, 0.1) > flattened_circle(10, 1, 1)
+assert flattened_circle(10, 10, 0.1) == flattened_circle(100, 1, 0.1)
+
+# Transform lists are applied left to right
+def transformed_point(transform):
+  points = []
+  class Collector(simple_svg_parser.HandlerInterface):
+    def moveTo(self, x, y): points.append((round(x, 6), round(y, 6)))
+  simple_svg_parser.parse('<svg><line transform="%s" x1="1" y1="2"/></svg>' % transform, Collector())
+  return points[0]
+assert transformed_point('translate(10 20) scale(2)') == (12, 24)
+assert transformed_point('scale(2), translate(10)') == (22, 4)
+assert transformed_point('rotate(90 1 1)') == (0, 1)
+assert transformed_point('skewX(45) skewY(45)') == (4, 3)
+assert transformed_point('matrix(1 0 0 1 5 5) translate(-5 -5)') == (1, 2)
+
+# Instances must draw the same as copies of what they refer to
+used = Handler()
+simple_svg_parser.parse(svg[-1], used)
+copied = Handler()
+simple_svg_parser.parse('''
+<svg xmlns="http://www.w3.org/2000/svg" width="500px" height="500px">
+  <path transform="translate(50 50)" d="M 0 -10 L 20 0 L 0 10 Z" fill="teal" stroke="black"/>
+  <g transform="rotate(30) translate(100 50)" opacity="0.5"><path d="M 0 -10 L 20 0 L 0 10 Z" fill="teal" stroke="black"/></g>
+  <g transform="translate(50 150)" opacity="0.5">
+    <circle r="10" fill="red"/>
+    <path transform="translate(15 0)" d="M 0 -10 L 20 0 L 0 10 Z" fill="teal" stroke="black"/>
+  </g>
+  <g transform="translate(0 100) translate(150 150)">
+    <rect x="-15" y="-15" width="30" height="30" rx="5" fill="gold"/>
+    <path transform="scale(0.5)" d="M 0 -10 L 20 0 L 0 10 Z" fill="teal" stroke="black"/>
+  </g>
+  <g transform="translate(0 100) translate(200 150)">
+    <rect x="-15" y="-15" width="30" height="30" rx="5" fill="gold"/>
+    <path transform="scale(0.5)" d="M 0 -10 L 20 0 L 0 10 Z" fill="teal" stroke="black"/>
+  </g>
+</svg>
+''', copied)
+assert used.lines == copied.lines
+
+# Arcs must follow the ellipse, checked against points sampled from its center
+# parameterization
+def check_arc(cx, cy, rx, ry, angle, start, end):
+  def point(t):
+    a, t = math.radians(angle), math.radians(t)
+    u, v = rx * math.cos(t), ry * math.sin(t)
+    return (cx + u * math.cos(a) - v * math.sin(a), cy + u * math.sin(a) + v * math.cos(a))
+  x0, y0 = point(start)
+  x1, y1 = point(end)
+  curves = []
+  class Collector(simple_svg_parser.HandlerInterface):
+    def curveTo(self, *args): curves.append(args)
+  simple_svg_parser.parse('<svg><path d="M %r %r A %r %r %r %d %d %r %r"/></svg>' % (x0, y0, rx, ry, angle,
+    abs(end - start) > 180, end > start, x1, y1), Collector())
+  samples = []
+  px, py = x0, y0
+  for x2, y2, x3, y3, x4, y4 in curves:
+    for i in range(101):
+      s = i / 100.0
+      a, b, c, d = (1 - s) ** 3, 3 * (1 - s) ** 2 * s, 3 * (1 - s) * s * s, s ** 3
+      samples.append((a * px + b * x2 + c * x3 + d * x4, a * py + b * y2 + c * y3 + d * y4))
+    px, py = x4, y4
+  assert len(curves) == int(math.ceil(abs(end - start) / 90.0 - 1e-9))
+  assert (px, py) == (x1, y1)
+  for i in range(101):
+    x, y = point(start + (end - start) * i / 100.0)
+    assert min(math.hypot(x - sx, y - sy) for sx, sy in samples) < max(rx, ry) * 0.02
+  a = math.radians(angle)
+  for x, y in samples:
+    u = ((x - cx) * math.cos(a) + (y - cy) * math.sin(a)) / rx
+    v = ((y - cy) * math.cos(a) - (x - cx) * math.sin(a)) / ry
+    assert abs(math.hypot(u, v) - 1) < 0.001
+check_arc(100, 100, 50, 30, 0, 0, 90)
+check_arc(100, 100, 50, 30, 30, 10, 300)
+check_arc(-20, 40, 10, 80, -75, 200, 20)
+check_arc(0, 0, 1000, 1, 45, 0, -359)
+
+# Bounds are tight around curves and can be queried by rectangle
+bounds = simple_svg_parser.Bounds()
+simple_svg_parser.parse('''
+<svg>
+  <circle cx="50" cy="50" r="10"/>
+  <path transform="translate(100 0)" d="M 0 0 C 0 100 100 100 100 0"/>
+  <path d=""/>
+  <rect transform="rotate(45)" width="10" height="10"/>
+</svg>
+''', Handler(), bounds=bounds)
+rounded = [tuple(round(x, 6) for x in box) if box else box for box in bounds.paths]
+assert rounded == [(40, 40, 60, 60), (100, 0, 200, 75), None, (-7.071068, 0, 7.071068, 14.142136)]
+assert bounds.query(0, 0, 45, 45) == [0, 3]
+assert bounds.query(150, 70, 160, 80) == [1]
+assert bounds.query(300, 300, 400, 400) == []
+assert bounds.query(-1000, -1000, 1000, 1000) == [0, 1, 3]
+
+# Clipping drops paths outside the rectangle, and a clip cache skips them on
+# later parses without changing the output
+everything = Handler()
+simple_svg_parser.parse(svg[0], everything, clip=(-1e9, -1e9, 1e9, 1e9))
+unclipped = Handler()
+simple_svg_parser.parse(svg[0], unclipped)
+assert everything.lines == unclipped.lines
+clipCache = {}
+for clip in [(0, 0, 250, 250), (250, 0, 500, 250), (0, 250, 250, 500), (250, 250, 500, 500), (0, 0, 100, 100)]:
+  tile = Handler()
+  simple_svg_parser.parse(svg[0], tile, clip=clip)
+  cached = Handler()
+  simple_svg_parser.parse(svg[0], cached, clip=clip, clipCache=clipCache)
+  streamed = Handler()
+  simple_svg_parser.parse_stream(io.BytesIO(svg[0].encode('utf8')), streamed, clip=clip, clipCache=clipCache)
+  assert cached.lines == tile.lines == streamed.lines
+  assert 0 < tile.lines.count('context.beginPath();') < everything.lines.count('context.beginPath();')
+
+# Definitions inside culled elements must still be found by <use> when
+# streaming with a clip cache
+reused = '<svg xmlns:xlink="http://www.w3.org/1999/xlink"><g><defs><rect id="r" width="10" height="10"/></defs></g><use xlink:href="#r"/></svg>'
+clipCache = {}
+for i in range(2):
+  cached = Handler()
+  simple_svg_parser.parse(reused, cached, clip=(0, 0, 100, 100), clipCache=clipCache)
+  streamed = Handler()
+  simple_svg_parser.parse_stream(io.BytesIO(reused.encode('utf8')), streamed, clip=(0, 0, 100, 100), clipCache=clipCache)
+  assert cached.lines.count('context.fill();') == streamed.lines.count('context.fill();') == 1
+
+# Simplification keeps every original point within the tolerance of the lines
+# that are left, and leaves the ends of runs and curves alone
+wave = [(x * 0.5, 20 * math.sin(x * 0.01)) for x in range(2000)]
+def simplified(tolerance):
+  calls = []
+  class Collector(simple_svg_parser.HandlerInterface):
+    def moveTo(self, x, y): calls.append(('M', x, y))
+    def lineTo(self, x, y): calls.append(('L', x, y))
+    def curveTo(self, *args): calls.append(('C',) + args)
+  simple_svg_parser.parse('<svg><path d="M%s C 1 2 3 4 5 6"/></svg>' % ' '.join('%r %r' % point for point in wave),
+    Collector(), simplify=tolerance)
+  return calls
+def distance(x, y, x1, y1, x2, y2):
+  dx, dy = x2 - x1, y2 - y1
+  t = max(0, min(1, ((x - x1) * dx + (y - y1) * dy) / (dx * dx + dy * dy)))
+  return math.hypot(x - x1 - t * dx, y - y1 - t * dy)
+for tolerance in [0.1, 1]:
+  calls = simplified(tolerance)
+  kept = [call[1:] for call in calls[:-1]]
+  assert calls[0] == ('M',) + wave[0] and kept[-1] == wave[-1] and calls[-1] == ('C', 1, 2, 3, 4, 5, 6)
+  assert len(kept) < len(wave) // 10
+  for x, y in wave:
+    assert min(distance(x, y, x1, y1, x2, y2) for (x1, y1), (x2, y2) in zip(kept, kept[1:])) <= tolerance
+assert len(simplified(1)) < len(simplified(0.1))
+
+# Stats count what was parsed and drawn and time each part of the parse
+reports = []
+stats = simple_svg_parser.Stats(callback=reports.append)
+text = '<svg><g transform="scale(2)"><path d="M0 0L1 1 2 2h3z" fill="red" stroke="blue"/><circle r="1" fill="none"/></g></svg>'
+simple_svg_parser.parse(text, Handler(), stats=stats)
+simple_svg_parser.parse_stream(io.BytesIO(text.encode('utf8')), Handler(), stats=stats)
+simple_svg_parser.parse_stream(io.BytesIO(text.encode('utf8')), Handler(), stats=stats)
+assert len(reports) == 3 and reports[2] == stats.asDict()
+assert stats.elements == {'svg': 3, 'g': 3, 'path': 3, 'circle': 3}
+assert stats.commands == {'M': 3, 'L': 6, 'H': 3, 'Z': 3}
+assert stats.segments == {'moveTo': 6, 'lineTo': 9, 'curveTo': 12, 'closePath': 6}
+assert stats.colors == 6
+assert stats.timings['load'] >= 0
+stats = simple_svg_parser.Stats()
+simple_svg_parser.parse('<svg><path d="M0 0L1 1"/><path d="M0 0L1 1"/></svg>', Handler(), stats=stats, geometryCache=simple_svg_parser.GeometryCache())
+assert stats.commands == {'M': 1, 'L': 1} and stats.segments == {'moveTo': 2, 'lineTo': 2}
+assert all(seconds >= 0 for seconds in stats.timings.values())
+
+# Shapes come out one at a time, and stopping early never reads the rest
+recorded = simple_svg_parser.record(svg[0])
+shapes = list(simple_svg_parser.iter_shapes(svg[0]))
+assert [(p.commands, p.coords, p.fill, p.stroke) for p in shapes] == [(p.commands, p.coords, p.fill, p.stroke) for p in recorded.paths]
+broken = '<svg><rect width="10" height="10" fill="gold"/>' + '<circle r="1"/>' * 10000 + '<path d="M 0 0 X"/></svg>'
+first = next(simple_svg_parser.iter_shapes(broken))
+assert list(first.coords) == [0, 0, 10, 0, 10, 10, 0, 10] and first.fill == (255, 215, 0, 1)
+
+# Nesting isn't limited by the recursion limit
+deep = Handler()
+simple_svg_parser.parse('<svg>%s<rect width="1" height="1"/>%s</svg>' % ('<g transform="translate(1)">' * 5000, '</g>' * 5000), deep)
+assert deep.lines[:2] == ['context.beginPath();', 'context.moveTo(5000.0, 0.0);']
+text = '<svg xmlns:xlink="http://www.w3.org/1999/xlink"><defs><g id="deep">%s<rect width="1" height="1"/>%s</g></defs><use xlink:href="#deep"/></svg>' % (
+  '<g transform="translate(1)">' * 5000, '</g>' * 5000)
+deep = Handler()
+simple_svg_parser.parse(text, deep)
+streamed = Handler()
+simple_svg_parser.parse_stream(io.BytesIO(text.encode('utf8')), streamed)
+assert deep.lines == streamed.lines and deep.lines[:2] == ['context.beginPath();', 'context.moveTo(5000.0, 0.0);']
+
+# Interned geometry draws the same as parsing it every time, and is shared
+# between documents within the memory bound
+geometry = simple_svg_parser.GeometryCache()
+for text in svg + svg:
+  interned = Handler()
+  simple_svg_parser.parse(text, interned, geometryCache=geometry)
+  direct = Handler()
+  simple_svg_parser.parse(text, direct)
+  assert interned.lines == direct.lines
+assert geometry.hits > geometry.misses == len(geometry.entries) > 0
+small = simple_svg_parser.GeometryCache(maxBytes=1000)
+simple_svg_parser.parse(svg[0], Handler(), geometryCache=small)
+assert 0 < small.bytes <= 1000 and len(small.entries) < geometry.misses
+
+# Vectorized transforms of recorded outlines give the same points, with or
+# without NumPy
+def numbers(lines):
+  return [float(x) for line in lines for x in re.findall(r'-?\d+(?:\.\d*)?(?:e-?\d+)?', line)]
+big = '<svg><path transform="rotate(30) scale(2 3)" d="M0 0%s"/></svg>' % ''.join('L%d %d' % (i, i * i % 97) for i in range(500))
+for text in svg + [big]:
+  vectorized = Handler()
+  simple_svg_parser.parse(text, vectorized, vectorize=True, geometryCache=simple_svg_parser.GeometryCache())
+  direct = Handler()
+  simple_svg_parser.parse(text, direct)
+  assert len(vectorized.lines) == len(direct.lines)
+  assert all(abs(a - b) < 1e-9 for a, b in zip(numbers(vectorized.lines), numbers(direct.lines)))
+replayed = Handler()
+simple_svg_parser.record(big).replay(replayed, matrix=(1, 2, 3, 4, 5, 6))
+expected = Handler()
+simple_svg_parser.parse('<svg><g transform="matrix(1 2 3 4 5 6)">%s</g></svg>' % big, expected)
+assert all(abs(a - b) < 1e-9 for a, b in zip(numbers(replayed.lines), numbers(expected.lines)))
+
+# Triangles cover exactly the filled area, following the fill rule for holes
+def triangulated_area(d, fillRule):
+  meshes = []
+  simple_svg_parser.parse('<svg><path d="%s" fill="red"/></svg>' % d, simple_svg_parser.TriangulatingHandler(meshes.append, fillRule=fillRule))
+  area = 0
+  for mesh in meshes:
+    assert mesh.fill == (255, 0, 0, 1) and len(mesh.indices) % 3 == 0
+    v = mesh.vertices
+    for a, b, c in zip(*[iter(mesh.indices)] * 3):
+      area += abs((v[2 * b] - v[2 * a]) * (v[2 * c + 1] - v[2 * a + 1]) - (v[2 * b + 1] - v[2 * a + 1]) * (v[2 * c] - v[2 * a])) / 2
+  return area
+holes = 'M0 0H30V30H0Z M2 2V10H10V2Z M12 12V20H20V12Z M14 14V18H18V14Z M22 2V8H28V2Z'
+assert triangulated_area(holes, 'evenodd') == triangulated_area(holes, 'nonzero') == 900 - 64 - 64 + 16 - 36
+assert triangulated_area('M0 0H10V10H0Z M3 3H7V7H3Z', 'nonzero') == 100
+assert triangulated_area('M0 0H10V10H0Z M3 3H7V7H3Z', 'evenodd') == 84
+
+# Contours that touch aren't mistaken for holes, and holes that touch the
+# outline are still cut out
+assert triangulated_area('M0 0H10V10Z M0 0V-10H-10Z', 'evenodd') == triangulated_area('M0 0H10V10Z M0 0V-10H-10Z', 'nonzero') == 100
+assert triangulated_area('M0 0H10V10H0Z M0 0L5 3L5 7Z M10 10L6 2L8 2Z', 'evenodd') == 100 - 10 - 8
+assert triangulated_area('M0 0H10V10H0Z M0 5L5 3L5 7Z', 'evenodd') == 90
+assert abs(triangulated_area('M0 0A10 10 0 0 0 0 20A10 10 0 0 0 0 0Z', 'nonzero') - math.pi * 100) < 2 * math.pi * 10 * 0.25
@@ -0,0 +1,51 @@
+import io
+import asyncio
+import simple_svg_parser
+import simple_svg_parser_async
+
+svg = '''
+<svg xmlns="http://www.w3.org/2000/svg" width="500px" height="500px">
+  <rect x="0" y="0" width="500" height="500" fill="#EEEEEE"/>
+  <g transform="rotate(10 250 250)" opacity="0.5">
+    <circle cx="95" cy="35" r="25" fill="#FF0000" stroke="black" stroke-width="4"/>
+    <path d="M 190 10 C 215 10 240 10 240 35 Q 215 35 215 60" fill="#00F" stroke="black" stroke-width="4"/>
+  </g>
+  <defs><ellipse id="e" rx="25" ry="15" fill="green"/></defs>
+  <use xlink:href="#e" x="300" y="300"/>
+''' + '  <polygon points="130 70 180 70 155 120" fill="gold"/>\n' * 100 + '</svg>'
+data = svg.encode('utf8')
+
+async def chunks(data):
+  for i in range(0, len(data), 1000):
+    yield data[i:i + 1000]
+
+async def ticker(ticks):
+  while True:
+    ticks.append(None)
+    await asyncio.sleep(0)
+
+# Both entry points give the same results as parse_stream() while letting
+# other tasks run
+async def main():
+  ticks = []
+  task = asyncio.ensure_future(ticker(ticks))
+  recorder = simple_svg_parser.RecordingHandler()
+  await simple_svg_parser_async.parse_async(chunks(data), recorder, sliceSize=500)
+  reader = asyncio.StreamReader()
+  reader.feed_data(data)
+  reader.feed_eof()
+  shapes = [shape async for shape in simple_svg_parser_async.iter_shapes_async(reader, sliceSize=500)]
+  task.cancel()
+  return recorder.result.paths, shapes, len(ticks)
+
+# asyncio.run() needs Python 3.7
+loop = asyncio.new_event_loop()
+asyncio.set_event_loop(loop)
+paths, shapes, ticks = loop.run_until_complete(main())
+loop.close()
+expected = simple_svg_parser.RecordingHandler()
+simple_svg_parser.parse_stream(io.BytesIO(data), expected)
+packed = lambda paths: [(p.commands, p.coords, p.fill, p.stroke) for p in paths]
+assert packed(paths) == packed(shapes) == packed(expected.result.paths)
+assert len(paths) == 104
+assert ticks >= 2 * (len(data) // 500)